@@ -1,28 +1,105 @@
 from __future__ import annotations
 
-import cgi
+import atexit
+import gzip
+import hashlib
+import io
 import json
+import multiprocessing
+import multiprocessing.queues
+import os
+import pickle
+import re
+import shutil
 import socket
 import sys
+import tempfile
 import threading
+import time
 import uuid
-import warnings
+import zlib
 import webbrowser
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import lru_cache
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+from typing import BinaryIO, Callable, Iterator
 from urllib.parse import parse_qs, urlparse
 
+import numpy as np
 import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from core import (
+    METRICS,
+    BalanceIndex,
+    Profiler,
+    ProgressCallback,
+    StageProgress,
+    StageScheduler,
+    StageTask,
+    analysis_key,
+    analyze_parsed_ledger,
+    build_balance_index,
+    cache_hit_rates,
+    columnar_export_available,
+    compact_frame,
+    day_ordinals,
+    ledger_file_diagnostics,
+    normalize_text,
+    parse_ledger,
+    prepare_plan,
+    profiled,
+    profiling,
+    read_csv_semicolon,
+    write_columnar,
+    write_csv,
+    write_excel,
+)
 
-from core import analyze_balances, dataframe_to_excel, ledger_file_diagnostics, read_csv_semicolon
-
-
-warnings.filterwarnings("ignore", message="'cgi' is deprecated.*", category=DeprecationWarning)
 
 HOST = "127.0.0.1"
 PORT = 8505
-ANALYSES: dict[str, pd.DataFrame] = {}
+PAGE_SIZE = 100
+CHUNK_SIZE = 64 * 1024
+MAX_PAGE_SIZE = 1000
+MAX_PART_HEADER = 16 * 1024
+COMPRESS_MIN_SIZE = 1024
+EXPORT_SPOOL_SIZE = 32 * 1024 * 1024
+EXPORT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "feather": "application/vnd.apache.arrow.file",
+}
+EXPORT_DATASETS = {"inconsistencias": "inconsistencias_saldos_diarios_sci", "resultado": "saldos_diarios_sci"}
+COMPRESS_LEVEL = 6
+BROTLI_QUALITY = 5
+STORE_MEMORY_BUDGET = int(os.environ.get("ANALISADOR_MEMORIA_MB", "1024")) * 1024 * 1024
+STORE_TTL = float(os.environ.get("ANALISADOR_TTL_HORAS", "24")) * 3600
+STORE_SPILL_DIR = os.environ.get("ANALISADOR_PASTA_TEMP", "")
+PROFILE_DIR = os.environ.get("ANALISADOR_PERFIL", "")
+EXPORT_CACHE_BUDGET = int(os.environ.get("ANALISADOR_CACHE_EXCEL_MB", "256")) * 1024 * 1024
+ANALYSIS_WORKERS = int(os.environ.get("ANALISADOR_ANALISES_SIMULTANEAS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING_JOBS = int(os.environ.get("ANALISADOR_FILA_MAXIMA", "8"))
+ANALYSIS_MEMORY_BUDGET = int(os.environ.get("ANALISADOR_MEMORIA_ANALISES_MB", "4096")) * 1024 * 1024
+UPLOAD_MEMORY_FACTOR = 40
+ADMISSION_WAIT = 30.0
+RETRY_AFTER = 10
+QUEUE_REFRESH = 2.0
+JOB_RETENTION = 3600
+SSE_KEEPALIVE = 15.0
+JOB_STAGES = {"queued": 0, "reading": 10, "parsing": 30, "analyzing": 60, "enriching": 85, "done": 100}
 LOGO_PATH = Path(__file__).with_name("logo_analisador_contabil.svg")
 
 
@@ -248,6 +325,9 @@ HTML = r"""<!doctype html>
       border-bottom: 1px solid var(--line);
       background: rgba(17, 29, 48, .45);
     }
+    .table-head [data-sort] { cursor: pointer; user-select: none; }
+    .table-head [data-sort].asc::after { content: " ▲"; color: var(--muted); }
+    .table-head [data-sort].desc::after { content: " ▼"; color: var(--muted); }
     .table-row {
       padding: 14px 24px; font-size: 13px; color: #dde6f5;
       border-bottom: 1px solid rgba(148, 163, 184, .12);
@@ -413,10 +493,11 @@ HTML = r"""<!doctype html>
           <div class="table">
             <div class="table-grid">
               <div class="table-head">
-                <div>Tipo</div><div>Código</div><div>Descrição</div><div>Saldo Esperado</div>
-                <div>Saldo Atual</div><div>Valor</div><div>1a Ocorrencia</div><div>Dias Afetados</div><div>Acoes</div>
+                <div data-sort="tipo">Tipo</div><div data-sort="codigo">Código</div><div data-sort="descricao">Descrição</div><div data-sort="esperado">Saldo Esperado</div>
+                <div data-sort="atual">Saldo Atual</div><div data-sort="valor">Valor</div><div data-sort="data">1a Ocorrencia</div><div data-sort="dias">Dias Afetados</div><div>Acoes</div>
               </div>
               <div id="tableBody"></div>
+              <div id="tableSentinel"></div>
             </div>
           </div>
           <div id="rowCount" class="count"></div>
@@ -449,8 +530,13 @@ HTML = r"""<!doctype html>
 
   <script>
     let rows = [];
+    let totalRows = 0;
     let analysisId = "";
     let ledgerFileName = "";
+    let sortKey = "";
+    let loadingRows = false;
+    let rowsRequest = 0;
+    let searchTimer = null;
 
     const money = new Intl.NumberFormat("pt-BR", { minimumFractionDigits: 2, maximumFractionDigits: 2 });
     const form = document.getElementById("uploadForm");
@@ -466,9 +552,18 @@ HTML = r"""<!doctype html>
 
       try {
         const response = await fetch("/analyze", { method: "POST", body: data });
-        const payload = await response.json();
-        if (!response.ok) throw new Error(payload.error || "Nao foi possivel analisar os arquivos.");
+        const job = await response.json();
+        if (response.status === 503) {
+          const retry = response.headers.get("Retry-After");
+          throw new Error(`${job.error}${retry ? ` Nova tentativa sugerida em ${retry} s.` : ""}`);
+        }
+        if (!response.ok) throw new Error(job.error || "Nao foi possivel analisar os arquivos.");
+        const finished = await waitForJob(job);
+        const resultResponse = await fetch(finished.result);
+        const payload = await resultResponse.json();
+        if (!resultResponse.ok) throw new Error(payload.error || "Nao foi possivel carregar o resultado.");
         rows = payload.rows || [];
+        totalRows = payload.total ?? rows.length;
         analysisId = payload.analysis_id;
         renderDashboard(payload.summary || {});
       } catch (error) {
@@ -479,9 +574,74 @@ HTML = r"""<!doctype html>
       }
     });
 
+    const stageLabels = {
+      queued: "Aguardando na fila",
+      reading: "Lendo arquivos",
+      parsing: "Interpretando o razão",
+      analyzing: "Analisando saldos",
+      running_balances: "Recalculando participantes",
+      collapsing: "Resumindo sequências",
+      enriching: "Preparando resultado",
+      done: "Concluído"
+    };
+
+    function describeJob(job) {
+      const event = job.event || {};
+      const label = stageLabels[job.stage] || "Analisando arquivos";
+      if (job.stage === "queued" && job.queue_position) return `${label}... posição ${job.queue_position} de ${job.queue_depth}`;
+      let detail = "";
+      if (event.stage === "parsing" && event.total) detail = ` · ${Number(event.done || 0).toLocaleString("pt-BR")} de ${Number(event.total).toLocaleString("pt-BR")} linhas`;
+      else if ((event.stage === "running_balances" || event.stage === "collapsing") && event.total) detail = ` · ${Number(event.done || 0).toLocaleString("pt-BR")} de ${Number(event.total).toLocaleString("pt-BR")} contas`;
+      return `${label}... ${job.percent || 0}%${detail}`;
+    }
+
+    function waitForJob(job) {
+      if (!window.EventSource) return pollJob(job);
+      return new Promise((resolve, reject) => {
+        const source = new EventSource(`${job.status_url}/events`);
+        source.onmessage = message => {
+          const current = JSON.parse(message.data);
+          statusBox.textContent = describeJob(current);
+          if (current.status === "done") {
+            source.close();
+            statusBox.textContent = "";
+            resolve(current);
+          } else if (current.status === "error") {
+            source.close();
+            reject(new Error(current.error || "Nao foi possivel analisar os arquivos."));
+          }
+        };
+        source.onerror = () => {
+          source.close();
+          pollJob(job).then(resolve, reject);
+        };
+      });
+    }
+
+    async function pollJob(job) {
+      let current = job;
+      while (current.status !== "done") {
+        if (current.status === "error") throw new Error(current.error || "Nao foi possivel analisar os arquivos.");
+        statusBox.textContent = describeJob(current);
+        await new Promise(resolve => setTimeout(resolve, 400));
+        const response = await fetch(current.status_url);
+        const payload = await response.json();
+        if (!response.ok) throw new Error(payload.error || "Nao foi possivel acompanhar a analise.");
+        current = payload;
+      }
+      statusBox.textContent = "";
+      return current;
+    }
+
     document.getElementById("newFileBtn").addEventListener("click", () => {
       rows = [];
+      totalRows = 0;
       analysisId = "";
+      sortKey = "";
+      clearTimeout(searchTimer);
+      document.getElementById("search").value = "";
+      document.getElementById("typeFilter").value = "";
+      document.querySelectorAll(".table-head [data-sort]").forEach(cell => cell.classList.remove("asc", "desc"));
       form.reset();
       document.getElementById("dashboard").classList.add("hidden");
       document.getElementById("uploadPanel").classList.remove("hidden");
@@ -494,8 +654,25 @@ HTML = r"""<!doctype html>
       statusBox.textContent = "";
     });
 
-    document.getElementById("search").addEventListener("input", renderTable);
-    document.getElementById("typeFilter").addEventListener("change", renderTable);
+    document.getElementById("search").addEventListener("input", () => {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(() => reloadRows(), 250);
+    });
+    document.getElementById("typeFilter").addEventListener("change", () => reloadRows());
+    document.querySelectorAll(".table-head [data-sort]").forEach(cell => {
+      cell.addEventListener("click", () => {
+        const key = cell.dataset.sort;
+        sortKey = sortKey === key ? `-${key}` : sortKey === `-${key}` ? "" : key;
+        document.querySelectorAll(".table-head [data-sort]").forEach(other => {
+          other.classList.toggle("asc", sortKey === other.dataset.sort);
+          other.classList.toggle("desc", sortKey === `-${other.dataset.sort}`);
+        });
+        reloadRows();
+      });
+    });
+    new IntersectionObserver(entries => {
+      if (entries.some(entry => entry.isIntersecting)) loadMoreRows();
+    }, { rootMargin: "600px" }).observe(document.getElementById("tableSentinel"));
 
     function renderDashboard(summary) {
       document.getElementById("uploadPanel").classList.add("hidden");
@@ -515,26 +692,57 @@ HTML = r"""<!doctype html>
       renderTable();
     }
 
-    function filteredRows() {
-      const query = normalize(document.getElementById("search").value);
-      const type = document.getElementById("typeFilter").value;
-      return rows.filter(row => {
-        if (type && row._tipo !== type) return false;
-        if (!query) return true;
-        return normalize(`${row._codigo} ${row._descricao} ${row["Conta analisada"] || ""}`).includes(query);
+    function rowsQuery(offset) {
+      return new URLSearchParams({
+        id: analysisId,
+        offset: String(offset),
+        limit: "100",
+        sort: sortKey,
+        q: document.getElementById("search").value,
+        tipo: document.getElementById("typeFilter").value
       });
     }
 
-    function renderTable() {
-      const visible = filteredRows();
+    async function fetchRows(offset) {
+      const request = ++rowsRequest;
+      loadingRows = true;
+      try {
+        const response = await fetch(`/rows?${rowsQuery(offset)}`);
+        const payload = await response.json();
+        if (!response.ok) throw new Error(payload.error || "Nao foi possivel carregar as linhas.");
+        if (request !== rowsRequest) return;
+        const page = payload.rows || [];
+        rows = offset ? rows.concat(page) : page;
+        totalRows = payload.total ?? rows.length;
+        renderTable(offset);
+      } catch (error) {
+        if (request === rowsRequest) document.getElementById("rowCount").textContent = error.message;
+      } finally {
+        if (request === rowsRequest) loadingRows = false;
+      }
+    }
+
+    function reloadRows() {
+      if (!analysisId) return;
+      fetchRows(0);
+    }
+
+    function loadMoreRows() {
+      if (!analysisId || loadingRows || rows.length >= totalRows) return;
+      fetchRows(rows.length);
+    }
+
+    function renderTable(offset = 0) {
       const body = document.getElementById("tableBody");
-      if (!visible.length) {
+      if (!rows.length) {
         body.innerHTML = '<div class="empty">Nenhum caso encontrado para os filtros atuais.</div>';
-        document.getElementById("rowCount").textContent = `Mostrando 0 de ${rows.length} resultados`;
+        document.getElementById("rowCount").textContent = `Mostrando 0 de ${totalRows} resultados`;
         return;
       }
-      body.innerHTML = visible.map((row, index) => renderRow(row, index)).join("");
-      document.getElementById("rowCount").textContent = `Mostrando ${visible.length} de ${rows.length} resultados`;
+      const html = rows.slice(offset).map((row, index) => renderRow(row, offset + index)).join("");
+      if (offset) body.insertAdjacentHTML("beforeend", html);
+      else body.innerHTML = html;
+      document.getElementById("rowCount").textContent = `Mostrando ${rows.length} de ${totalRows} resultados`;
     }
 
     function renderRow(row, index) {
@@ -555,8 +763,8 @@ HTML = r"""<!doctype html>
       `;
     }
 
-    function openDetails(index) {
-      const row = filteredRows()[index];
+    async function openDetails(index) {
+      const row = rows[index];
       if (!row) return;
       document.getElementById("detailTitle").textContent = row["Conta analisada"] || "Detalhes da inconsistência";
       document.getElementById("detailSubtitle").textContent = row._descricao || "";
@@ -580,9 +788,20 @@ HTML = r"""<!doctype html>
         <div class="detail-card"><span>${escapeHtml(label)}</span><strong>${escapeHtml(String(value))}</strong></div>
       `).join("");
 
-      document.getElementById("detailChart").innerHTML = buildChart(row._history || []);
-      document.getElementById("detailRows").innerHTML = buildMiniTable(row._detail_rows || []);
+      document.getElementById("detailChart").innerHTML = '<div class="empty">Carregando histórico...</div>';
+      document.getElementById("detailRows").innerHTML = "";
       document.getElementById("detailModal").classList.add("open");
+
+      try {
+        const params = new URLSearchParams({ id: analysisId, account: row["Conta analisada"] || "", row: row._row ?? "" });
+        const response = await fetch(`/history?${params}`);
+        const detail = await response.json();
+        if (!response.ok) throw new Error(detail.error || "Nao foi possivel carregar o historico.");
+        document.getElementById("detailChart").innerHTML = buildChart(detail.history || []);
+        document.getElementById("detailRows").innerHTML = buildMiniTable(detail.detail_rows || []);
+      } catch (error) {
+        document.getElementById("detailChart").innerHTML = `<div class="empty">${escapeHtml(error.message)}</div>`;
+      }
     }
 
     function closeDetails(event) {
@@ -642,9 +861,6 @@ HTML = r"""<!doctype html>
       const formatted = money.format(Math.abs(number));
       return number < 0 ? `(${formatted})` : formatted;
     }
-    function normalize(value) {
-      return String(value || "").normalize("NFD").replace(/[\u0300-\u036f]/g, "").toLowerCase().trim();
-    }
     function escapeHtml(value) {
       return String(value).replace(/[&<>"']/g, c => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", "\"": "&quot;", "'": "&#039;" }[c]));
     }
@@ -657,6 +873,8 @@ HTML = r"""<!doctype html>
 
 
 class AppHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
     def do_GET(self) -> None:
         parsed = urlparse(self.path)
         if parsed.path == "/":
@@ -668,6 +886,27 @@ class AppHandler(BaseHTTPRequestHandler):
         if parsed.path == "/export":
             self.handle_export(parsed.query)
             return
+        if parsed.path == "/history":
+            self.handle_history(parsed.query)
+            return
+        if parsed.path == "/rows":
+            self.handle_rows(parsed.query)
+            return
+        if parsed.path == "/result":
+            self.handle_result(parsed.query)
+            return
+        if parsed.path.startswith("/jobs/") and parsed.path.endswith("/events"):
+            self.handle_job_events(parsed.path.removeprefix("/jobs/").removesuffix("/events"))
+            return
+        if parsed.path.startswith("/jobs/"):
+            self.handle_job(parsed.path.removeprefix("/jobs/"))
+            return
+        if parsed.path == "/metrics":
+            self.handle_metrics(parsed.query)
+            return
+        if parsed.path == "/stats":
+            self.send_json({"store": ANALYSES.stats(), "jobs": JOBS.stats(), "admission": ADMISSION.stats(), "exports": EXPORTS.stats()})
+            return
         self.send_error(HTTPStatus.NOT_FOUND, "Pagina nao encontrada")
 
     def do_POST(self) -> None:
@@ -677,91 +916,1224 @@ class AppHandler(BaseHTTPRequestHandler):
         self.handle_analyze()
 
     def handle_analyze(self) -> None:
+        reserved = 0
+        uploads: dict[str, UploadFile] = {}
         try:
-            form = cgi.FieldStorage(
-                fp=self.rfile,
-                headers=self.headers,
-                environ={
-                    "REQUEST_METHOD": "POST",
-                    "CONTENT_TYPE": self.headers.get("Content-Type", ""),
-                    "CONTENT_LENGTH": self.headers.get("Content-Length", "0"),
-                },
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0:
+                self.close_connection = True
+                self.send_json({"error": "Envie o plano de contas e o razao diario."}, HTTPStatus.LENGTH_REQUIRED, {"Connection": "close"})
+                return
+            reserved = ADMISSION.reserve(length)
+            with StageProgress(None, "receiving") as receiving:
+                uploads = {"plan": UploadFile(STORE_SPILL_DIR or None), "ledger": UploadFile(STORE_SPILL_DIR or None)}
+                try:
+                    read_multipart(
+                        self.rfile,
+                        self.headers.get("Content-Type", ""),
+                        length,
+                        {name: upload.feed for name, upload in uploads.items()},
+                    )
+                finally:
+                    for upload in uploads.values():
+                        upload.close()
+            if any(not upload.size for upload in uploads.values()):
+                raise ValueError("Envie o plano de contas e o razao diario.")
+
+            content_key = analysis_key(uploads["plan"].hash.hexdigest(), uploads["ledger"].hash.hexdigest())
+            job = JOBS.lookup(content_key)
+            if job is not None:
+                ADMISSION.release(reserved)
+            else:
+                job = JOBS.submit(
+                    uploads.pop("plan").path,
+                    uploads.pop("ledger").path,
+                    {"receiving": round(receiving.elapsed, 4)},
+                    reserved,
+                    content_key,
+                )
+        except UploadTooLarge as exc:
+            self.close_connection = True
+            self.send_json({"error": str(exc)}, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"Connection": "close"})
+            return
+        except JobQueueFull as exc:
+            ADMISSION.release(reserved)
+            self.close_connection = True
+            self.send_json(
+                {"error": str(exc), "admission": ADMISSION.stats(), "jobs": JOBS.stats()},
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"Retry-After": str(exc.retry_after), "Connection": "close"},
             )
+            return
+        except Exception as exc:
+            ADMISSION.release(reserved)
+            self.close_connection = True
+            self.send_json({"error": str(exc)}, HTTPStatus.BAD_REQUEST)
+            return
+        finally:
+            discard_uploads([upload.path for upload in uploads.values()])
+        self.send_json(JOBS.describe(job), HTTPStatus.ACCEPTED)
+
+    def handle_job(self, job_id: str) -> None:
+        job = JOBS.get(job_id)
+        if job is None:
+            self.send_json({"error": "Processamento nao encontrado"}, HTTPStatus.NOT_FOUND)
+            return
+        self.send_json(JOBS.describe(job))
 
-            plan_item = form["plan"] if "plan" in form else None
-            ledger_item = form["ledger"] if "ledger" in form else None
-            if plan_item is None or ledger_item is None:
-                raise ValueError("Envie o plano de contas e o razao diario.")
+    def handle_job_events(self, job_id: str) -> None:
+        job = JOBS.get(job_id)
+        if job is None:
+            self.send_json({"error": "Processamento nao encontrado"}, HTTPStatus.NOT_FOUND)
+            return
 
-            plan_df = read_csv_semicolon(plan_item.file)
-            ledger_df = read_csv_semicolon(ledger_item.file)
-            result, inconsistencies = analyze_balances(ledger_df, plan_df)
-            report = enrich_report(inconsistencies if not inconsistencies.empty else result.head(0), result)
-            diagnostics = ledger_file_diagnostics(ledger_df)
+        self.close_connection = True
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
 
-            analysis_id = uuid.uuid4().hex
-            ANALYSES[analysis_id] = report.drop(columns=[column for column in report.columns if column.startswith("_")])
+        cursor = 0
+        try:
+            while True:
+                events, cursor = job.wait_events(cursor, QUEUE_REFRESH if job.stage == "queued" else SSE_KEEPALIVE)
+                status = JOBS.describe(job)
+                finished = status["status"] in {"done", "error"}
+                if not events and status["status"] == "queued":
+                    events = [None]
+                elif not events and not finished:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events or ([None] if finished else []):
+                    message = json.dumps({**status, "event": event}, ensure_ascii=False)
+                    self.wfile.write(f"data: {message}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if finished:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
 
-            payload = {
-                "analysis_id": analysis_id,
-                "rows": json.loads(report.to_json(orient="records", force_ascii=False)),
-                "summary": build_summary(result, inconsistencies),
-                "warnings": build_warnings(diagnostics),
-            }
-            self.send_json(payload)
-        except Exception as exc:
-            self.send_json({"error": str(exc)}, HTTPStatus.BAD_REQUEST)
+    def handle_metrics(self, query: str) -> None:
+        snapshot = METRICS.snapshot()
+        gauges = {"store": ANALYSES.stats(), "jobs": JOBS.stats(), "admission": ADMISSION.stats(), "exports": EXPORTS.stats()}
+        if parse_qs(query).get("format", [""])[0] == "json":
+            self.send_json({**snapshot, "cache_hit_rates": cache_hit_rates(snapshot["counters"]), **gauges})
+            return
 
-    def handle_export(self, query: str) -> None:
+        data = prometheus_text(snapshot, gauges).encode("utf-8")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_result(self, query: str) -> None:
         analysis_id = parse_qs(query).get("id", [""])[0]
-        result = ANALYSES.get(analysis_id)
-        if result is None:
+        analysis = ANALYSES.get(analysis_id)
+        if analysis is None:
+            self.send_json({"error": "Analise nao encontrada"}, HTTPStatus.NOT_FOUND)
+            return
+
+        positions, total = analysis.page(0, PAGE_SIZE)
+        payload = {
+            "analysis_id": analysis_id,
+            "total": total,
+            "summary": analysis.summary,
+            "warnings": analysis.warnings,
+        }
+        self.send_json_rows(payload, analysis.rows(positions))
+
+    def handle_export(self, query: str) -> None:
+        params = parse_qs(query)
+        analysis_id = params.get("id", [""])[0]
+        file_format = params.get("format", ["xlsx"])[0]
+        dataset = params.get("dados", ["inconsistencias"])[0]
+        if analysis_id not in ANALYSES:
             self.send_error(HTTPStatus.NOT_FOUND, "Analise nao encontrada")
             return
+        if file_format not in EXPORT_TYPES or dataset not in EXPORT_DATASETS or (file_format == "xlsx" and dataset != "inconsistencias"):
+            self.send_error(HTTPStatus.BAD_REQUEST, "Formato de exportacao invalido")
+            return
+        if file_format in {"parquet", "feather"} and not columnar_export_available():
+            self.send_error(HTTPStatus.NOT_IMPLEMENTED, "Exportacao em Parquet ou Feather requer o pacote pyarrow")
+            return
 
-        data = dataframe_to_excel(result)
-        self.send_response(HTTPStatus.OK)
-        self.send_header("Content-Type", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-        self.send_header("Content-Disposition", 'attachment; filename="analise_saldos_diarios_sci.xlsx"')
+        if file_format != "xlsx":
+            analysis = ANALYSES.get(analysis_id)
+            if analysis is None:
+                self.send_error(HTTPStatus.NOT_FOUND, "Analise nao encontrada")
+                return
+            decimal = "," if params.get("decimal", ["ponto"])[0] == "virgula" else "."
+            self.stream_table_export(analysis, dataset, file_format, decimal)
+            return
+
+        with EXPORTS.building(analysis_id):
+            data = EXPORTS.get(analysis_id)
+            if data is None:
+                analysis = ANALYSES.get(analysis_id)
+                if analysis is None:
+                    self.send_error(HTTPStatus.NOT_FOUND, "Analise nao encontrada")
+                    return
+                self.stream_export(analysis_id, analysis)
+                return
+
+        self.send_export_headers()
         self.send_header("Content-Length", str(len(data)))
         self.end_headers()
         self.wfile.write(data)
 
+    def stream_export(self, analysis_id: str, analysis: StoredAnalysis) -> None:
+        self.send_export_headers()
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        writer = ChunkedWriter(self.wfile)
+        target = TeeWriter(writer, EXPORTS.memory_budget)
+        profiler = Profiler(PROFILE_DIR) if PROFILE_DIR else None
+        try:
+            write_excel(analysis.export_frame(), target, profiler)
+            writer.close()
+            if profiler is not None:
+                profiler.write(Path(PROFILE_DIR) / f"export-{analysis_id}-{time.time_ns()}.json")
+            data = target.copied()
+            if data is not None:
+                EXPORTS.put(analysis_id, data)
+        finally:
+            target.discard()
+
+    def stream_table_export(self, analysis: StoredAnalysis, dataset: str, file_format: str, decimal: str) -> None:
+        frame = analysis.result if dataset == "resultado" else analysis.export_frame()
+        filename = f"{EXPORT_DATASETS[dataset]}.{file_format}"
+        if file_format == "csv":
+            encoding = self.accepted_encoding()
+            self.send_export_headers(filename, EXPORT_TYPES[file_format])
+            self.send_header("Vary", "Accept-Encoding")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            writer = ChunkedWriter(self.wfile, encoding=encoding)
+            write_csv(frame, writer, decimal)
+            writer.close()
+            return
+
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as spool:
+            try:
+                write_columnar(frame, spool, file_format)
+            except (TypeError, ValueError) as exc:
+                self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, f"Nao foi possivel gerar a exportacao: {exc}")
+                return
+            size = spool.tell()
+            spool.seek(0)
+            self.send_export_headers(filename, EXPORT_TYPES[file_format])
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            shutil.copyfileobj(spool, self.wfile, CHUNK_SIZE)
+
+    def send_export_headers(
+        self,
+        filename: str = "analise_saldos_diarios_sci.xlsx",
+        content_type: str = EXPORT_TYPES["xlsx"],
+    ) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+
+    def handle_rows(self, query: str) -> None:
+        params = parse_qs(query)
+        analysis = ANALYSES.get(params.get("id", [""])[0])
+        if analysis is None:
+            self.send_json({"error": "Analise nao encontrada"}, HTTPStatus.NOT_FOUND)
+            return
+
+        offset = query_int(params, "offset", 0)
+        limit = min(query_int(params, "limit", PAGE_SIZE), MAX_PAGE_SIZE)
+        positions, total = analysis.page(
+            offset,
+            limit,
+            sort=params.get("sort", [""])[0],
+            query=params.get("q", [""])[0],
+            tipo=params.get("tipo", [""])[0],
+        )
+        self.send_json_rows(
+            {"offset": offset, "limit": limit, "total": total, "count": len(analysis.report)},
+            analysis.rows(positions),
+        )
+
+    def handle_history(self, query: str) -> None:
+        params = parse_qs(query)
+        analysis = ANALYSES.get(params.get("id", [""])[0])
+        if analysis is None:
+            self.send_json({"error": "Analise nao encontrada"}, HTTPStatus.NOT_FOUND)
+            return
+
+        account = params.get("account", [""])[0]
+        position = analysis.issue_position(account, params.get("row", [""])[0])
+        if position is None:
+            self.send_json({"error": "Conta nao encontrada na analise"}, HTTPStatus.NOT_FOUND)
+            return
+        self.send_json(analysis.history(position))
+
     def handle_logo(self) -> None:
         if not LOGO_PATH.exists():
             self.send_error(HTTPStatus.NOT_FOUND, "Logo nao encontrado")
             return
-
-        data = LOGO_PATH.read_bytes()
-        self.send_response(HTTPStatus.OK)
-        self.send_header("Content-Type", "image/svg+xml; charset=utf-8")
-        self.send_header("Cache-Control", "no-store")
-        self.send_header("Content-Length", str(len(data)))
-        self.end_headers()
-        self.wfile.write(data)
+        self.send_static(file_asset(LOGO_PATH, LOGO_PATH.stat().st_mtime_ns), "image/svg+xml; charset=utf-8")
 
     def send_html(self, html: str) -> None:
-        data = html.encode("utf-8")
+        self.send_static(html_asset(html), "text/html; charset=utf-8")
+
+    def send_static(self, asset: StaticAsset, content_type: str) -> None:
+        if asset.etag in {tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")}:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", asset.etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+
+        encoding = self.accepted_encoding()
+        data = asset.encoded(encoding)
         self.send_response(HTTPStatus.OK)
-        self.send_header("Content-Type", "text/html; charset=utf-8")
-        self.send_header("Cache-Control", "no-store")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("ETag", asset.etag)
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
         self.send_header("Content-Length", str(len(data)))
         self.end_headers()
         self.wfile.write(data)
 
-    def send_json(self, payload: dict, status: HTTPStatus = HTTPStatus.OK) -> None:
+    def accepted_encoding(self) -> str:
+        return negotiate_encoding(self.headers.get("Accept-Encoding", ""))
+
+    def send_json(self, payload: dict, status: HTTPStatus = HTTPStatus.OK, headers: dict[str, str] | None = None) -> None:
         data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        encoding = self.accepted_encoding() if len(data) >= COMPRESS_MIN_SIZE else ""
+        if encoding:
+            data = compress_bytes(data, encoding)
         self.send_response(status)
         self.send_header("Content-Type", "application/json; charset=utf-8")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
         self.send_header("Content-Length", str(len(data)))
         self.end_headers()
         self.wfile.write(data)
 
+    def send_json_rows(self, payload: dict, rows: Iterator[str], status: HTTPStatus = HTTPStatus.OK) -> None:
+        encoding = self.accepted_encoding()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        writer = ChunkedWriter(self.wfile, encoding=encoding)
+        head = json.dumps(payload, ensure_ascii=False)[:-1]
+        writer.write(f'{head}{", " if payload else ""}"rows": ['.encode("utf-8"))
+        separator = ""
+        for chunk in rows:
+            if chunk:
+                writer.write(f"{separator}{chunk}".encode("utf-8"))
+                separator = ", "
+        writer.write(b"]}")
+        writer.close()
+
     def log_message(self, format: str, *args: object) -> None:
         return
 
 
-def enrich_report(report: pd.DataFrame, result: pd.DataFrame | None = None) -> pd.DataFrame:
+@dataclass
+class StoredAnalysis:
+    report: pd.DataFrame
+    index: BalanceIndex
+    summary: dict[str, object] = field(default_factory=dict)
+    warnings: list[str] = field(default_factory=list)
+    search: pd.Series = field(default_factory=lambda: pd.Series(dtype=str))
+    orders: dict[str, np.ndarray] = field(default_factory=dict)
+    result: pd.DataFrame = field(default_factory=pd.DataFrame)
+
+    @classmethod
+    def build(
+        cls,
+        report: pd.DataFrame,
+        index: BalanceIndex,
+        summary: dict[str, object] | None = None,
+        warnings: list[str] | None = None,
+        result: pd.DataFrame | None = None,
+    ) -> StoredAnalysis:
+        report = report.reset_index(drop=True)
+        summary = summary or {}
+        warnings = warnings or []
+        result = result if result is not None else pd.DataFrame()
+        if report.empty:
+            return cls(report=report, index=index, summary=summary, warnings=warnings, result=result)
+
+        search = (
+            report["_codigo"].astype(str) + " " + report["_descricao"].astype(str) + " " + report["Conta analisada"].astype(str)
+        ).map(normalize_text)
+        return cls(
+            report=report,
+            index=index,
+            summary=summary,
+            warnings=warnings,
+            search=search,
+            orders=build_sort_orders(report),
+            result=result,
+        )
+
+    def page(self, offset: int, limit: int, sort: str = "", query: str = "", tipo: str = "") -> tuple[np.ndarray, int]:
+        if self.report.empty:
+            return np.zeros(0, dtype=np.int64), 0
+
+        key = sort.lstrip("-")
+        order = self.orders.get(key, np.arange(len(self.report)))
+        if sort.startswith("-") and key in self.orders:
+            order = order[::-1]
+
+        mask = np.ones(len(self.report), dtype=bool)
+        if tipo:
+            mask &= self.report["_tipo"].to_numpy() == tipo
+        query = normalize_text(query)
+        if query:
+            mask &= self.search.str.contains(query, regex=False).to_numpy()
+
+        selected = order[mask[order]]
+        return selected[offset : offset + limit], len(selected)
+
+    @property
+    def nbytes(self) -> int:
+        report = int(self.report.memory_usage(deep=True).sum())
+        search = int(self.search.memory_usage(deep=True))
+        result = int(self.result.memory_usage(deep=True).sum())
+        return report + search + result + self.index.nbytes + sum(order.nbytes for order in self.orders.values())
+
+    def rows(self, positions: np.ndarray) -> Iterator[str]:
+        return iter_json_records(self.report.iloc[positions].assign(_row=positions))
+
+    def export_frame(self) -> pd.DataFrame:
+        return self.report.drop(columns=[column for column in self.report.columns if column.startswith("_")])
+
+    def issue_position(self, account: str, row: str = "") -> int | None:
+        if row.isdigit() and int(row) < len(self.report):
+            if str(self.report["Conta analisada"].iat[int(row)]) == account:
+                return int(row)
+        matches = np.flatnonzero(self.report["Conta analisada"].astype(str).to_numpy() == account)
+        return int(matches[0]) if len(matches) else None
+
+    def history(self, position: int) -> dict[str, object]:
+        windows = issue_windows(self.report.iloc[[position]], self.index)
+        found, history_lo, history_hi, involved_lo, involved_hi = (values[0] for values in windows)
+        row = self.report.iloc[position]
+        if not found:
+            return {
+                "account": row["Conta analisada"],
+                "history": [],
+                "detail_rows": [],
+                "launch_count": str(row.get("Dias impactados", "1") or "1"),
+            }
+        return {
+            "account": row["Conta analisada"],
+            "history": self.index.points(slice(history_lo, history_hi)),
+            "detail_rows": self.index.points(slice(involved_lo, involved_hi)),
+            "launch_count": str(involved_hi - involved_lo),
+        }
+
+
+@dataclass
+class StoreEntry:
+    analysis: StoredAnalysis | None
+    nbytes: int
+    last_access: float
+    path: Path | None = None
+    spilling: bool = False
+    reload_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class AnalysisStore:
+    def __init__(self, memory_budget: int, ttl: float, spill_dir: Path | None = None) -> None:
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self.entries: OrderedDict[str, StoreEntry] = OrderedDict()
+        self.lock = threading.RLock()
+        self.resident_bytes = 0
+        self.spilling_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "spills": 0, "reloads": 0, "expired": 0}
+
+    def put(self, analysis_id: str, analysis: StoredAnalysis) -> None:
+        nbytes = analysis.nbytes
+        with self.lock:
+            self.expire()
+            self.drop(analysis_id)
+            entry = StoreEntry(analysis=analysis, nbytes=nbytes, last_access=time.monotonic())
+            self.entries[analysis_id] = entry
+            self.resident_bytes += entry.nbytes
+            victims = self.evict()
+        self.spill(victims)
+
+    def get(self, analysis_id: str) -> StoredAnalysis | None:
+        with self.lock:
+            self.expire()
+            entry = self.entries.get(analysis_id)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+
+            self.counters["hits"] += 1
+            entry.last_access = time.monotonic()
+            self.entries.move_to_end(analysis_id)
+            if entry.analysis is not None:
+                return entry.analysis
+
+        with entry.reload_lock:
+            with self.lock:
+                if entry.analysis is not None:
+                    return entry.analysis
+                path = entry.path
+            try:
+                analysis = self.reload(path)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                with self.lock:
+                    if self.entries.get(analysis_id) is entry:
+                        self.drop(analysis_id)
+                return None
+            with self.lock:
+                self.counters["reloads"] += 1
+                victims: list[tuple[str, StoreEntry, StoredAnalysis, Path]] = []
+                if self.entries.get(analysis_id) is entry and entry.analysis is None:
+                    entry.analysis = analysis
+                    self.resident_bytes += entry.nbytes
+                    victims = self.evict()
+        self.spill(victims)
+        return analysis
+
+    def __contains__(self, analysis_id: str) -> bool:
+        with self.lock:
+            return analysis_id in self.entries
+
+    def drop(self, analysis_id: str) -> None:
+        entry = self.entries.pop(analysis_id, None)
+        if entry is None:
+            return
+        if entry.analysis is not None:
+            self.resident_bytes -= entry.nbytes
+        if entry.spilling:
+            entry.spilling = False
+            self.spilling_bytes -= entry.nbytes
+        if entry.path is not None:
+            entry.path.unlink(missing_ok=True)
+
+    def expire(self) -> None:
+        if self.ttl <= 0:
+            return
+        deadline = time.monotonic() - self.ttl
+        for analysis_id in [key for key, entry in self.entries.items() if entry.last_access < deadline]:
+            self.drop(analysis_id)
+            self.counters["expired"] += 1
+
+    def evict(self) -> list[tuple[str, StoreEntry, StoredAnalysis, Path]]:
+        victims = []
+        for analysis_id, entry in list(self.entries.items())[:-1]:
+            if self.resident_bytes - self.spilling_bytes <= self.memory_budget:
+                break
+            if entry.analysis is None or entry.spilling:
+                continue
+            if entry.path is not None:
+                entry.analysis = None
+                self.resident_bytes -= entry.nbytes
+                self.counters["spills"] += 1
+                continue
+            entry.spilling = True
+            self.spilling_bytes += entry.nbytes
+            victims.append((analysis_id, entry, entry.analysis, self.spill_path(analysis_id)))
+        return victims
+
+    def spill(self, victims: list[tuple[str, StoreEntry, StoredAnalysis, Path]]) -> None:
+        for analysis_id, entry, analysis, path in victims:
+            try:
+                with gzip.open(path, "wb", compresslevel=1) as handle:
+                    pickle.dump(analysis, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError:
+                path.unlink(missing_ok=True)
+                with self.lock:
+                    if entry.spilling:
+                        entry.spilling = False
+                        self.spilling_bytes -= entry.nbytes
+                continue
+            with self.lock:
+                if not entry.spilling:
+                    path.unlink(missing_ok=True)
+                    continue
+                entry.spilling = False
+                self.spilling_bytes -= entry.nbytes
+                entry.path = path
+                entry.analysis = None
+                self.resident_bytes -= entry.nbytes
+                self.counters["spills"] += 1
+
+    def reload(self, path: Path | None) -> StoredAnalysis:
+        if path is None:
+            raise FileNotFoundError("Analise sem copia em disco")
+        with gzip.open(path, "rb") as handle:
+            return pickle.load(handle)
+
+    def spill_path(self, analysis_id: str) -> Path:
+        if self.spill_dir is None:
+            self.spill_dir = Path(tempfile.mkdtemp(prefix="analisador_contabil_"))
+            atexit.register(shutil.rmtree, self.spill_dir, ignore_errors=True)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        return self.spill_dir / f"{analysis_id}-{time.time_ns()}.pkl.gz"
+
+    def stats(self) -> dict[str, object]:
+        with self.lock:
+            resident = sum(1 for entry in self.entries.values() if entry.analysis is not None)
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "analyses": len(self.entries),
+                "resident": resident,
+                "spilled": len(self.entries) - resident,
+                "resident_bytes": self.resident_bytes,
+                "memory_budget": self.memory_budget,
+                "ttl_seconds": self.ttl,
+            }
+
+
+ANALYSES = AnalysisStore(STORE_MEMORY_BUDGET, STORE_TTL, Path(STORE_SPILL_DIR) if STORE_SPILL_DIR else None)
+
+
+class ExportCache:
+    def __init__(self, memory_budget: int) -> None:
+        self.memory_budget = memory_budget
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.locks: dict[str, tuple[threading.Lock, int]] = {}
+        self.lock = threading.Lock()
+        self.cached_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @contextmanager
+    def building(self, key: str) -> Iterator[None]:
+        with self.lock:
+            lock, holders = self.locks.get(key, (threading.Lock(), 0))
+            self.locks[key] = (lock, holders + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self.lock:
+                lock, holders = self.locks[key]
+                if holders == 1:
+                    del self.locks[key]
+                else:
+                    self.locks[key] = (lock, holders - 1)
+
+    def get(self, key: str) -> bytes | None:
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            self.entries.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_budget:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            self.cached_bytes -= len(previous) if previous is not None else 0
+            self.entries[key] = data
+            self.cached_bytes += len(data)
+            while self.cached_bytes > self.memory_budget:
+                _, evicted = self.entries.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+                self.counters["evictions"] += 1
+
+    def stats(self) -> dict[str, object]:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "cached_bytes": self.cached_bytes,
+                "memory_budget": self.memory_budget,
+            }
+
+
+EXPORTS = ExportCache(EXPORT_CACHE_BUDGET)
+
+
+class JobQueueFull(Exception):
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class AdmissionControl:
+    def __init__(self, budget: int, factor: int, max_waiting: int, wait: float) -> None:
+        self.budget = budget
+        self.factor = factor
+        self.max_waiting = max_waiting
+        self.wait = wait
+        self.reserved = 0
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.changed = threading.Condition()
+
+    def estimate(self, length: int) -> int:
+        return length * self.factor
+
+    def reserve(self, length: int) -> int:
+        amount = self.estimate(length)
+        with self.changed:
+            if amount > self.budget:
+                self.rejected += 1
+                limit = self.budget // self.factor // (1024 * 1024)
+                raise UploadTooLarge(f"Arquivos grandes demais para este servidor (limite aproximado de {limit} MB por envio).")
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise JobQueueFull(self.busy_message(), RETRY_AFTER)
+            self.waiting += 1
+            try:
+                admitted = self.changed.wait_for(lambda: self.reserved + amount <= self.budget, self.wait)
+            finally:
+                self.waiting -= 1
+            if not admitted:
+                self.rejected += 1
+                raise JobQueueFull(self.busy_message(), RETRY_AFTER)
+            self.reserved += amount
+            self.active += 1
+            self.admitted += 1
+            return amount
+
+    def release(self, amount: int) -> None:
+        if not amount:
+            return
+        with self.changed:
+            self.reserved -= amount
+            self.active -= 1
+            self.changed.notify_all()
+
+    def busy_message(self) -> str:
+        return f"Servidor ocupado: {self.active} analise(s) em andamento e {self.waiting} aguardando. Tente novamente em instantes."
+
+    def stats(self) -> dict[str, object]:
+        with self.changed:
+            return {
+                "memory_budget": self.budget,
+                "reserved_bytes": self.reserved,
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+ADMISSION = AdmissionControl(ANALYSIS_MEMORY_BUDGET, UPLOAD_MEMORY_FACTOR, MAX_PENDING_JOBS, ADMISSION_WAIT)
+
+
+@dataclass
+class AnalysisJob:
+    job_id: str
+    created: float = field(default_factory=time.monotonic)
+    stage: str = "queued"
+    percent: int = 0
+    analysis_id: str = ""
+    error: str = ""
+    reserved: int = 0
+    content_key: str = ""
+    finished: float | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+    events: list[dict[str, object]] = field(default_factory=list)
+    changed: threading.Condition = field(default_factory=threading.Condition)
+
+    def record(self, event: dict[str, object]) -> None:
+        stage = str(event["stage"])
+        with self.changed:
+            if self.finished is not None:
+                return
+            if stage in JOB_STAGES:
+                self.stage = stage
+                self.percent = stage_percent(stage, int(event.get("done", 0)), int(event.get("total", 0)))
+            if event["event"] == "end":
+                self.timings[stage] = round(self.timings.get(stage, 0.0) + float(event.get("elapsed", 0.0)), 4)
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def finish(self, analysis_id: str = "", error: str = "", timings: dict[str, float] | None = None) -> None:
+        with self.changed:
+            self.analysis_id = analysis_id
+            self.error = error
+            self.finished = time.monotonic()
+            self.timings.update(timings or {})
+            if analysis_id:
+                self.stage = "done"
+                self.percent = JOB_STAGES["done"]
+            self.changed.notify_all()
+
+    def wait_events(self, cursor: int, timeout: float) -> tuple[list[dict[str, object]], int]:
+        with self.changed:
+            if cursor >= len(self.events) and self.finished is None:
+                self.changed.wait(timeout)
+            return self.events[cursor:], len(self.events)
+
+    def status(self) -> dict[str, object]:
+        state = "error" if self.error else "done" if self.analysis_id else "queued" if self.stage == "queued" else "running"
+        return {
+            "job_id": self.job_id,
+            "status": state,
+            "stage": self.stage,
+            "percent": self.percent,
+            "error": self.error,
+            "analysis_id": self.analysis_id,
+            "result": f"/result?id={self.analysis_id}" if self.analysis_id else "",
+            "status_url": f"/jobs/{self.job_id}",
+            "timings": dict(self.timings),
+        }
+
+
+def stage_percent(stage: str, done: int, total: int) -> int:
+    start = JOB_STAGES[stage]
+    later = [percent for percent in JOB_STAGES.values() if percent > start]
+    end = min(later) if later else start
+    fraction = min(done / total, 1.0) if total else 0.0
+    return int(start + (end - start) * fraction)
+
+
+class JobManager:
+    def __init__(self, workers: int, max_pending: int, retention: float) -> None:
+        self.executor: ProcessPoolExecutor | None = None
+        self.events: multiprocessing.queues.Queue | None = None
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self.jobs: dict[str, AnalysisJob] = {}
+        self.by_content: dict[str, str] = {}
+        self.results: dict[str, str] = {}
+        self.counters = {"dedup_hits": 0, "dedup_misses": 0}
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.completions = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analise-conclusao")
+
+    def start(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                return
+            context = multiprocessing.get_context("spawn")
+            if self.events is None:
+                self.events = context.Queue()
+                threading.Thread(target=self.forward_events, name="analise-eventos", daemon=True).start()
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(self.events,),
+            )
+            executor = self.executor
+        for _ in range(self.workers):
+            executor.submit(warm_worker)
+
+    def submit(
+        self,
+        plan_path: str,
+        ledger_path: str,
+        timings: dict[str, float] | None = None,
+        reserved: int = 0,
+        content_key: str = "",
+    ) -> AnalysisJob:
+        self.start()
+        with self.lock:
+            self.prune()
+            if self.pending >= self.max_pending:
+                discard_uploads([plan_path, ledger_path])
+                raise JobQueueFull("Servidor ocupado com outras analises. Tente novamente em instantes.", RETRY_AFTER)
+            job = AnalysisJob(job_id=uuid.uuid4().hex, reserved=reserved, content_key=content_key, timings=dict(timings or {}))
+            self.jobs[job.job_id] = job
+            if content_key:
+                self.by_content[content_key] = job.job_id
+            self.pending += 1
+            executor = self.executor
+        try:
+            if executor is None:
+                raise RuntimeError("Executor de analises encerrado")
+            future = executor.submit(analysis_task, job.job_id, plan_path, ledger_path)
+        except RuntimeError as exc:
+            discard_uploads([plan_path, ledger_path])
+            with self.lock:
+                self.jobs.pop(job.job_id, None)
+                if self.by_content.get(content_key) == job.job_id:
+                    self.by_content.pop(content_key)
+                self.pending -= 1
+            self.reset(executor)
+            raise JobQueueFull("O servico de analise foi reiniciado. Tente novamente em instantes.", RETRY_AFTER) from exc
+        future.add_done_callback(lambda done: self.completions.submit(self.complete, job, done, [plan_path, ledger_path], executor))
+        return job
+
+    def get(self, job_id: str) -> AnalysisJob | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def lookup(self, content_key: str) -> AnalysisJob | None:
+        with self.lock:
+            job = self.jobs.get(self.by_content.get(content_key, ""))
+            if job is not None and not job.error and (job.finished is None or job.analysis_id in ANALYSES):
+                self.counters["dedup_hits"] += 1
+                return job
+
+            analysis_id = self.results.get(content_key, "")
+            if analysis_id in ANALYSES:
+                job = AnalysisJob(job_id=uuid.uuid4().hex, content_key=content_key)
+                job.finish(analysis_id=analysis_id)
+                self.jobs[job.job_id] = job
+                self.by_content[content_key] = job.job_id
+                self.counters["dedup_hits"] += 1
+                return job
+
+            self.by_content.pop(content_key, None)
+            self.results.pop(content_key, None)
+            self.counters["dedup_misses"] += 1
+            return None
+
+    def describe(self, job: AnalysisJob) -> dict[str, object]:
+        status = job.status()
+        with self.lock:
+            queued = [other.created for other in self.jobs.values() if other.finished is None and other.stage == "queued"]
+        status["queue_depth"] = len(queued)
+        status["queue_position"] = sum(1 for created in queued if created <= job.created) if status["status"] == "queued" else 0
+        return status
+
+    def complete(self, job: AnalysisJob, future: Future, sources: list[str], executor: ProcessPoolExecutor) -> None:
+        try:
+            fields, timings, metrics = future.result()
+            METRICS.merge(metrics)
+            analysis_id = uuid.uuid4().hex
+            ANALYSES.put(analysis_id, StoredAnalysis(**fields))
+            if job.content_key:
+                with self.lock:
+                    self.results[job.content_key] = analysis_id
+            job.finish(analysis_id=analysis_id, timings=timings)
+        except BrokenProcessPool:
+            self.reset(executor)
+            job.finish(error="O processo de analise foi interrompido. Envie os arquivos novamente.")
+        except Exception as exc:
+            job.finish(error=str(exc) or exc.__class__.__name__)
+        finally:
+            discard_uploads(sources)
+            ADMISSION.release(job.reserved)
+            with self.lock:
+                self.pending -= 1
+
+    def reset(self, failed: ProcessPoolExecutor | None) -> None:
+        with self.lock:
+            if failed is None or self.executor is not failed:
+                return
+            self.executor = None
+        failed.shutdown(wait=False, cancel_futures=True)
+
+    def forward_events(self) -> None:
+        while True:
+            job_id, event = self.events.get()
+            job = self.get(job_id)
+            if job is not None:
+                job.record(event)
+
+    def prune(self) -> None:
+        deadline = time.monotonic() - self.retention
+        for job_id in [key for key, job in self.jobs.items() if job.finished is not None and job.finished < deadline]:
+            del self.jobs[job_id]
+        for content_key in [key for key, job_id in self.by_content.items() if job_id not in self.jobs]:
+            del self.by_content[content_key]
+        for content_key in [key for key, analysis_id in self.results.items() if analysis_id not in ANALYSES]:
+            del self.results[content_key]
+
+    def stats(self) -> dict[str, object]:
+        with self.lock:
+            running = sum(1 for job in self.jobs.values() if job.finished is None and job.stage != "queued")
+            lookups = self.counters["dedup_hits"] + self.counters["dedup_misses"]
+            return {
+                **self.counters,
+                "dedup_hit_rate": self.counters["dedup_hits"] / lookups if lookups else 0.0,
+                "workers": self.workers,
+                "pending": self.pending,
+                "running": running,
+                "queued": self.pending - running,
+                "max_pending": self.max_pending,
+            }
+
+
+WORKER_EVENTS: multiprocessing.queues.Queue | None = None
+
+
+def init_worker(events: multiprocessing.queues.Queue) -> None:
+    global WORKER_EVENTS
+    WORKER_EVENTS = events
+
+
+def warm_worker() -> None:
+    read_csv_semicolon(io.BytesIO("C\u00f3digo;Nome\n1;Caixa\n".encode("utf-8")))
+    Workbook().save(io.BytesIO())
+    METRICS.snapshot(reset=True)
+
+
+def analysis_task(
+    job_id: str,
+    plan_path: str,
+    ledger_path: str,
+) -> tuple[dict[str, object], dict[str, float], dict[str, object]]:
+    timings: dict[str, float] = {}
+
+    def progress(event: dict[str, object]) -> None:
+        if event["event"] == "end":
+            stage = str(event["stage"])
+            timings[stage] = round(timings.get(stage, 0.0) + float(event["elapsed"]), 4)
+        if WORKER_EVENTS is not None:
+            WORKER_EVENTS.put((job_id, event))
+
+    profiler = Profiler(PROFILE_DIR) if PROFILE_DIR else None
+    with profiling(profiler, "analysis"):
+        with open(plan_path, "rb") as plan_source, open(ledger_path, "rb") as ledger_source:
+            analysis = run_analysis(plan_source, ledger_source, progress)
+    if profiler is not None:
+        profiler.write(Path(PROFILE_DIR) / f"analysis-{job_id}.json")
+    return vars(analysis), timings, METRICS.snapshot(reset=True)
+
+
+def run_analysis(
+    plan_source: BinaryIO,
+    ledger_source: BinaryIO,
+    progress: ProgressCallback | None = None,
+) -> StoredAnalysis:
+    plan_df = read_csv_semicolon(plan_source, progress)
+    ledger_df = read_csv_semicolon(ledger_source, progress)
+
+    with profiled("plan_prep"):
+        plan = prepare_plan(plan_df)
+    with profiled("parse"):
+        ledger = parse_ledger(ledger_df, progress)
+    result, inconsistencies = analyze_parsed_ledger(ledger, plan, progress)
+
+    issues = inconsistencies if not inconsistencies.empty else result.head(0)
+    with StageProgress(progress, "enriching", total=len(inconsistencies)) as stage:
+        scheduler = StageScheduler(progress)
+        outputs = scheduler.run(
+            [
+                StageTask("balance_index", lambda: build_balance_index(result)),
+                StageTask("enrichment", lambda index: enrich_report(issues, result, index, include_history=False), ("balance_index",)),
+                StageTask("diagnostics", lambda: build_warnings(ledger_file_diagnostics(ledger_df))),
+                StageTask("summary", lambda: build_summary(result, inconsistencies)),
+                StageTask("compact_result", lambda: compact_frame(result)),
+            ]
+        )
+        analysis = StoredAnalysis.build(
+            outputs["enrichment"],
+            outputs["balance_index"],
+            summary=outputs["summary"],
+            warnings=outputs["diagnostics"],
+            result=outputs["compact_result"],
+        )
+        stage.done = len(inconsistencies)
+    return analysis
+
+
+JOBS = JobManager(ANALYSIS_WORKERS, MAX_PENDING_JOBS, JOB_RETENTION)
+
+
+class ChunkedWriter:
+    def __init__(self, wfile: BinaryIO, buffer_size: int = CHUNK_SIZE, encoding: str = "") -> None:
+        self.wfile = wfile
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.compressor = StreamCompressor(encoding) if encoding else None
+
+    def write(self, data: bytes) -> int:
+        self.buffer += self.compressor.compress(data) if self.compressor is not None else data
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        self.wfile.write(f"{len(self.buffer):X}\r\n".encode("ascii") + bytes(self.buffer) + b"\r\n")
+        self.buffer.clear()
+
+    def close(self) -> None:
+        if self.compressor is not None:
+            self.buffer += self.compressor.finish()
+        self.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class TeeWriter:
+    def __init__(self, target: ChunkedWriter, copy_limit: int) -> None:
+        self.target = target
+        self.copy_limit = copy_limit
+        self.copy: BinaryIO | None = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+
+    def write(self, data: bytes) -> int:
+        self.target.write(data)
+        if self.copy is not None:
+            if self.copy.tell() + len(data) > self.copy_limit:
+                self.discard()
+            else:
+                self.copy.write(data)
+        return len(data)
+
+    def flush(self) -> None:
+        return
+
+    def copied(self) -> bytes | None:
+        if self.copy is None:
+            return None
+        self.copy.seek(0)
+        data = self.copy.read()
+        self.discard()
+        return data
+
+    def discard(self) -> None:
+        if self.copy is not None:
+            self.copy.close()
+            self.copy = None
+
+
+class StreamCompressor:
+    def __init__(self, encoding: str) -> None:
+        if encoding == "br":
+            engine = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress: Callable[[bytes], bytes] = engine.process
+            self.finish: Callable[[], bytes] = engine.finish
+        else:
+            engine = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+            self.compress = engine.compress
+            self.finish = engine.flush
+
+
+@dataclass
+class StaticAsset:
+    data: bytes
+    etag: str
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, data: bytes) -> StaticAsset:
+        return cls(data=data, etag=f'"{hashlib.sha256(data).hexdigest()[:20]}"')
+
+    def encoded(self, encoding: str) -> bytes:
+        if not encoding:
+            return self.data
+        if encoding not in self.variants:
+            self.variants[encoding] = compress_bytes(self.data, encoding, best=True)
+        return self.variants[encoding]
+
+
+@lru_cache(maxsize=4)
+def html_asset(html: str) -> StaticAsset:
+    return StaticAsset.build(html.encode("utf-8"))
+
+
+@lru_cache(maxsize=4)
+def file_asset(path: Path, mtime_ns: int) -> StaticAsset:
+    return StaticAsset.build(path.read_bytes())
+
+
+def negotiate_encoding(header: str) -> str:
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return ""
+
+
+def compress_bytes(data: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else COMPRESS_LEVEL, mtime=0)
+
+
+def iter_json_records(frame: pd.DataFrame, batch_size: int = 1000) -> Iterator[str]:
+    columns = [str(column) for column in frame.columns]
+    values = [frame[column].astype(object).where(frame[column].notna(), None).tolist() for column in frame.columns]
+    for start in range(0, len(frame), batch_size):
+        batch = [dict(zip(columns, row)) for row in zip(*(column[start : start + batch_size] for column in values))]
+        yield json.dumps(batch, ensure_ascii=False)[1:-1]
+
+
+def build_sort_orders(report: pd.DataFrame) -> dict[str, np.ndarray]:
+    days, has_day = day_ordinals(report["Data"])
+    keys = {
+        "tipo": report["_tipo"].astype(str).str.lower(),
+        "codigo": report["_codigo"].astype(str).map(sort_code_key),
+        "descricao": report["_descricao"].map(normalize_text),
+        "esperado": report["_esperado"].astype(str),
+        "atual": report["_atual"].astype(str),
+        "valor": pd.to_numeric(report["Saldo final do dia"], errors="coerce").fillna(0.0),
+        "data": pd.Series(np.where(has_day, days, np.iinfo(np.int64).max)),
+        "dias": pd.to_numeric(report["Dias impactados"], errors="coerce").fillna(1),
+    }
+    return {name: np.argsort(values.to_numpy(), kind="stable") for name, values in keys.items()}
+
+
+def sort_code_key(value: str) -> str:
+    return " - ".join(part.strip().zfill(12) if part.strip().isdigit() else part.strip() for part in value.split(" - "))
+
+
+def issue_windows(report: pd.DataFrame, index: BalanceIndex) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    positions = index.locate(report["Conta analisada"].astype(str).tolist())
+    found = positions >= 0
+    if not len(index):
+        empty = np.zeros(len(report), dtype=np.int64)
+        return found, empty, empty, empty, empty
+    safe_positions = np.where(found, positions, 0)
+
+    starts, has_start = day_ordinals(report["Data"])
+    end_column = "Data final da sequencia" if "Data final da sequencia" in report.columns else "Data"
+    ends, has_end = day_ordinals(report[end_column])
+    starts = np.where(has_start, starts, index.days[index.offsets[safe_positions]])
+    ends = np.where(has_end, ends, starts)
+
+    history_lo, history_hi = index.windows(safe_positions, starts - 45, ends)
+    history_lo = np.maximum(history_lo, history_hi - 80)
+    involved_lo, involved_hi = index.windows(safe_positions, starts, ends)
+    same_day_lo, same_day_hi = index.windows(safe_positions, starts, starts)
+    no_involved = involved_lo == involved_hi
+    involved_lo = np.where(no_involved, same_day_lo, involved_lo)
+    involved_hi = np.where(no_involved, same_day_hi, involved_hi)
+    return found, history_lo, history_hi, involved_lo, involved_hi
+
+
+def enrich_report(
+    report: pd.DataFrame,
+    result: pd.DataFrame | None = None,
+    index: BalanceIndex | None = None,
+    include_history: bool = True,
+) -> pd.DataFrame:
     report = report.copy()
     if report.empty:
         return report
@@ -771,58 +2143,32 @@ def enrich_report(report: pd.DataFrame, result: pd.DataFrame | None = None) -> p
     report["_descricao"] = report.apply(display_description, axis=1)
     report["_esperado"] = report["Natureza esperada"].map({"credora": "Credor", "devedora": "Devedor"}).fillna("Revisao")
     report["_atual"] = report["Natureza esperada"].map({"credora": "Devedor", "devedora": "Credor"}).fillna("Revisao")
-    report["_history"] = [[] for _ in range(len(report))]
-    report["_detail_rows"] = [[] for _ in range(len(report))]
+    if include_history:
+        report["_history"] = [[] for _ in range(len(report))]
+        report["_detail_rows"] = [[] for _ in range(len(report))]
     report["_launch_count"] = report["Dias impactados"].fillna(1).astype(str)
 
-    if result is not None and not result.empty:
-        history_by_account = {}
-        result_work = result.copy()
-        result_work["_data_dt"] = pd.to_datetime(result_work["Data"], format="%d/%m/%Y", errors="coerce")
-        for account, group in result_work.sort_values("_data_dt").groupby("Conta analisada", sort=False):
-            history_by_account[account] = group
+    if index is None and result is not None and not result.empty:
+        index = build_balance_index(result)
 
+    if index is not None and len(index):
+        found, history_lo, history_hi, involved_lo, involved_hi = issue_windows(report, index)
+        launch_counts = report["_launch_count"].tolist()
+        days_impacted = report["Dias impactados"].tolist()
         histories = []
         detail_rows = []
-        launch_counts = []
-        for _, row in report.iterrows():
-            account = row.get("Conta analisada", "")
-            group = history_by_account.get(account, pd.DataFrame())
-            if group.empty:
-                histories.append([])
-                detail_rows.append([])
-                launch_counts.append(str(row.get("Dias impactados", "1") or "1"))
-                continue
-
-            start = pd.to_datetime(row.get("Data", ""), format="%d/%m/%Y", errors="coerce")
-            end = pd.to_datetime(row.get("Data final da sequencia", row.get("Data", "")), format="%d/%m/%Y", errors="coerce")
-            if pd.isna(start):
-                start = group["_data_dt"].min()
-            if pd.isna(end):
-                end = start
-
-            window_start = start - pd.Timedelta(days=45)
-            history = group[group["_data_dt"].between(window_start, end)].tail(80)
-            involved = group[group["_data_dt"].between(start, end)]
-            if involved.empty:
-                involved = group[group["_data_dt"].eq(start)]
-
-            histories.append(
-                [
-                    {"data": item["Data"], "saldo": float(item["Saldo final do dia"])}
-                    for _, item in history.iterrows()
-                ]
-            )
-            detail_rows.append(
-                [
-                    {"data": item["Data"], "saldo": float(item["Saldo final do dia"])}
-                    for _, item in involved.iterrows()
-                ]
-            )
-            launch_counts.append(str(len(involved)))
-
-        report["_history"] = histories
-        report["_detail_rows"] = detail_rows
+        for position, is_found in enumerate(found.tolist()):
+            if not is_found:
+                launch_counts[position] = str(days_impacted[position] or "1")
+            else:
+                launch_counts[position] = str(involved_hi[position] - involved_lo[position])
+            if include_history:
+                histories.append(index.points(slice(history_lo[position], history_hi[position])) if is_found else [])
+                detail_rows.append(index.points(slice(involved_lo[position], involved_hi[position])) if is_found else [])
+
+        if include_history:
+            report["_history"] = histories
+            report["_detail_rows"] = detail_rows
         report["_launch_count"] = launch_counts
     return report
 
@@ -883,6 +2229,146 @@ def build_warnings(diagnostics: dict[str, object]) -> list[str]:
     return ["Contas encontradas como blocos de razao neste arquivo: " + ", ".join(str(code) for code in account_codes)]
 
 
+class UploadFile:
+    def __init__(self, directory: str | None = None) -> None:
+        self.file = tempfile.NamedTemporaryFile(prefix="analisador_envio_", suffix=".csv", dir=directory, delete=False)
+        self.path = self.file.name
+        self.size = 0
+        self.hash = hashlib.sha256()
+
+    def feed(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.size += len(chunk)
+        self.hash.update(chunk)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def discard_uploads(paths: list[str]) -> None:
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def read_multipart(
+    stream: BinaryIO,
+    content_type: str,
+    length: int,
+    handlers: dict[str, Callable[[bytes], None]],
+) -> None:
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not content_type.startswith("multipart/form-data") or match is None:
+        raise ValueError("Envio invalido: esperado multipart/form-data.")
+    if length <= 0:
+        raise ValueError("Envio invalido: tamanho do envio nao informado.")
+
+    delimiter = b"\r\n--" + match.group(1).encode("latin1")
+    buffer = b"\r\n"
+    remaining = length
+    sink: Callable[[bytes], None] | None = None
+    state = "preamble"
+
+    while True:
+        if state == "preamble":
+            position = buffer.find(delimiter)
+            if position >= 0:
+                buffer = buffer[position + len(delimiter) :]
+                state = "boundary"
+                continue
+            buffer = buffer[-len(delimiter) :]
+        elif state == "boundary":
+            if len(buffer) >= 2:
+                if buffer.startswith(b"--"):
+                    while remaining > 0:
+                        chunk = stream.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            return
+                        remaining -= len(chunk)
+                    return
+                state = "headers"
+                continue
+        elif state == "headers":
+            end = buffer.find(b"\r\n\r\n")
+            if end >= 0:
+                sink = handlers.get(multipart_field_name(buffer[:end]))
+                buffer = buffer[end + 4 :]
+                state = "body"
+                continue
+            if len(buffer) > MAX_PART_HEADER:
+                raise ValueError("Envio invalido: cabecalho de parte muito grande.")
+        else:
+            position = buffer.find(delimiter)
+            if position >= 0:
+                if sink is not None and position:
+                    sink(buffer[:position])
+                buffer = buffer[position + len(delimiter) :]
+                state = "boundary"
+                continue
+            keep = len(delimiter) - 1
+            if sink is not None and len(buffer) > keep:
+                sink(buffer[:-keep])
+            buffer = buffer[-keep:]
+
+        if remaining <= 0:
+            raise ValueError("Envio incompleto: o arquivo nao chegou inteiro.")
+        chunk = stream.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError("Envio incompleto: o arquivo nao chegou inteiro.")
+        remaining -= len(chunk)
+        buffer += chunk
+
+
+def multipart_field_name(raw_headers: bytes) -> str:
+    for line in raw_headers.decode("utf-8", "replace").split("\r\n"):
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-disposition":
+            match = re.search(r'(?:^|;)\s*name="([^"]*)"', value)
+            return match.group(1) if match else ""
+    return ""
+
+
+def prometheus_text(snapshot: dict[str, object], gauges: dict[str, dict[str, object]]) -> str:
+    lines = [
+        "# HELP analisador_stage_seconds Duracao de cada etapa da analise.",
+        "# TYPE analisador_stage_seconds histogram",
+    ]
+    for stage, histogram in sorted(snapshot["stages"].items()):
+        for bound, count in zip(snapshot["buckets"], histogram["buckets"]):
+            lines.append(f'analisador_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'analisador_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'analisador_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+        lines.append(f'analisador_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"# TYPE analisador_{name}_total counter")
+        lines.append(f"analisador_{name}_total {prometheus_value(value)}")
+
+    lines.append("# TYPE analisador_cache_hit_ratio gauge")
+    for name, rate in cache_hit_rates(snapshot["counters"]).items():
+        lines.append(f'analisador_cache_hit_ratio{{cache="{name}"}} {rate:.6f}')
+
+    for group, values in gauges.items():
+        for name, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE analisador_{group}_{name} gauge")
+                lines.append(f"analisador_{group}_{name} {prometheus_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def prometheus_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def query_int(params: dict[str, list[str]], name: str, default: int) -> int:
+    value = params.get(name, [""])[0]
+    return int(value) if value.isdigit() else default
+
+
 def find_port(start: int) -> int:
     port = start
     while True:
@@ -895,6 +2381,7 @@ def find_port(start: int) -> int:
 def main() -> None:
     requested_port = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else PORT
     port = find_port(requested_port)
+    JOBS.start()
     server = ThreadingHTTPServer((HOST, port), AppHandler)
     url = f"http://{HOST}:{port}"
     print(f"Servidor local aberto em {url}")
@@ -1,21 +1,48 @@
 from __future__ import annotations
 
+import cProfile
+import hashlib
 import io
 import csv
+import json
+import os
 import re
+import threading
+import time
+import tracemalloc
 import unicodedata
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 from dataclasses import dataclass
 from functools import lru_cache
 from datetime import datetime
-from typing import BinaryIO
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, Sequence
 
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook
-from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 
 ACCOUNT_RE = re.compile(r"^\s*(\d+)\s*-\s*(.+?)\s*$")
 DATE_RE = re.compile(r"^\s*(\d{2}/\d{2}/\d{4})\s*$")
+PROGRESS_ROWS_STEP = 20000
+PROGRESS_ACCOUNTS_STEP = 50
+ENGINE_VERSION = "2026.10"
+EXPORT_CHUNK_ROWS = 100_000
+SCHEDULER_WORKERS = min(4, os.cpu_count() or 1)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
 
 REQUIRED_LEDGER_COLUMNS = [
     "Hist\u00f3rico",
@@ -159,15 +186,283 @@ def parse_date_cached(text: str) -> pd.Timestamp:
         return pd.NaT
 
 
-def read_csv_semicolon(uploaded_file: BinaryIO) -> pd.DataFrame:
-    raw = uploaded_file.read()
-    try:
-        uploaded_file.seek(0)
-    except (AttributeError, OSError):
-        pass
+CACHED_FUNCTIONS = {
+    "normalize_text": normalize_text_cached,
+    "parse_brazilian_number": parse_brazilian_number_cached,
+    "parse_date": parse_date_cached,
+}
+
+ProgressCallback = Callable[[dict[str, object]], None]
+
+
+class Metrics:
+    def __init__(self, buckets: Sequence[float] = STAGE_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters: dict[str, float] = {}
+        self.stages: dict[str, dict[str, object]] = {}
+        self.cache_seen: dict[str, tuple[int, int]] = {}
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            histogram = self.stage_histogram(stage)
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][position] += 1
+
+    def stage_histogram(self, stage: str) -> dict[str, object]:
+        if stage not in self.stages:
+            self.stages[stage] = {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)}
+        return self.stages[stage]
+
+    def collect_caches(self) -> None:
+        for name, cached in CACHED_FUNCTIONS.items():
+            info = cached.cache_info()
+            hits, misses = self.cache_seen.get(name, (0, 0))
+            self.cache_seen[name] = (info.hits, info.misses)
+            self.counters[f"cache_{name}_hits"] = self.counters.get(f"cache_{name}_hits", 0) + max(info.hits - hits, 0)
+            self.counters[f"cache_{name}_misses"] = self.counters.get(f"cache_{name}_misses", 0) + max(info.misses - misses, 0)
+
+    def snapshot(self, reset: bool = False) -> dict[str, object]:
+        with self.lock:
+            self.collect_caches()
+            snapshot = {
+                "buckets": list(self.buckets),
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: {**histogram, "buckets": list(histogram["buckets"])}
+                    for stage, histogram in self.stages.items()
+                },
+            }
+            if reset:
+                self.counters.clear()
+                self.stages.clear()
+            return snapshot
+
+    def merge(self, snapshot: dict[str, object]) -> None:
+        with self.lock:
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for stage, other in snapshot["stages"].items():
+                histogram = self.stage_histogram(stage)
+                histogram["count"] += other["count"]
+                histogram["sum"] += other["sum"]
+                histogram["buckets"] = [mine + theirs for mine, theirs in zip(histogram["buckets"], other["buckets"])]
+
+
+def cache_hit_rates(counters: dict[str, float]) -> dict[str, float]:
+    rates = {}
+    for name in CACHED_FUNCTIONS:
+        hits = counters.get(f"cache_{name}_hits", 0)
+        lookups = hits + counters.get(f"cache_{name}_misses", 0)
+        rates[name] = hits / lookups if lookups else 0.0
+    return rates
+
+
+METRICS = Metrics()
+
+
+class Profiler:
+    def __init__(self, cprofile_dir: str | Path | None = None, trace_memory: bool = True) -> None:
+        self.cprofile_dir = Path(cprofile_dir) if cprofile_dir else None
+        self.trace_memory = trace_memory
+        self.stages: list[dict[str, object]] = []
+        self.runs: list[dict[str, object]] = []
+        self.open_peaks: list[int] = []
+
+    @contextmanager
+    def activate(self, label: str) -> Iterator[Profiler]:
+        token = ACTIVE_PROFILER.set(self)
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        profile = cProfile.Profile() if self.cprofile_dir is not None else None
+        run: dict[str, object] = {"label": label, "cprofile": ""}
+        try:
+            if profile is not None:
+                profile.enable()
+            with self.stage(label):
+                yield self
+        finally:
+            if profile is not None:
+                profile.disable()
+                self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+                path = self.cprofile_dir / f"{label}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof"
+                profile.dump_stats(path)
+                run["cprofile"] = str(path)
+            if started_tracing:
+                tracemalloc.stop()
+            ACTIVE_PROFILER.reset(token)
+            self.runs.append(run)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        tracing = tracemalloc.is_tracing()
+        current = tracemalloc.get_traced_memory()[0] if tracing else 0
+        if tracing:
+            if self.open_peaks:
+                self.open_peaks[-1] = max(self.open_peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.open_peaks.append(0)
+        entry: dict[str, object] = {"stage": name, "depth": len(self.open_peaks) - 1}
+        self.stages.append(entry)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 6)
+            peak = max(self.open_peaks.pop(), tracemalloc.get_traced_memory()[1] if tracing else 0)
+            entry["peak_bytes"] = max(peak - current, 0)
+            if self.open_peaks:
+                self.open_peaks[-1] = max(self.open_peaks[-1], peak)
+
+    def report(self) -> dict[str, object]:
+        return {"stages": [dict(entry) for entry in self.stages], "runs": list(self.runs)}
+
+    def write(self, path: str | Path) -> None:
+        Path(path).write_text(json.dumps(self.report(), indent=2), encoding="utf-8")
+
+
+ACTIVE_PROFILER: ContextVar[Profiler | None] = ContextVar("ACTIVE_PROFILER", default=None)
+
+
+@contextmanager
+def profiled(name: str) -> Iterator[None]:
+    profiler = ACTIVE_PROFILER.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+@contextmanager
+def profiling(profiler: Profiler | None, label: str) -> Iterator[None]:
+    if profiler is None or ACTIVE_PROFILER.get() is profiler:
+        yield
+        return
+    with profiler.activate(label):
+        yield
+
+
+class StageProgress:
+    def __init__(self, progress: ProgressCallback | None, stage: str, total: int = 0, step: int = 1) -> None:
+        self.progress = progress
+        self.stage = stage
+        self.total = total
+        self.step = max(step, 1)
+        self.done = 0
+        self.details: dict[str, object] = {}
+        self.started = 0.0
+        self.elapsed = 0.0
+        self.next_report = self.step
+
+    def __enter__(self) -> StageProgress:
+        self.started = time.perf_counter()
+        self.emit("start")
+        return self
+
+    def __exit__(self, exc_type: object, exc: object, traceback: object) -> None:
+        self.elapsed = time.perf_counter() - self.started
+        if exc_type is None:
+            METRICS.observe(self.stage, self.elapsed)
+            self.emit("end")
+
+    def update(self, done: int) -> None:
+        self.done = done
+        if self.progress is not None and done >= self.next_report:
+            self.next_report = done + self.step
+            self.emit("progress")
+
+    def emit(self, event: str, **values: object) -> None:
+        if self.progress is None:
+            return
+        self.progress(
+            {
+                "stage": self.stage,
+                "event": event,
+                "done": self.done,
+                "total": self.total,
+                "elapsed": round(time.perf_counter() - self.started, 4),
+                **self.details,
+                **values,
+            }
+        )
+
+
+@dataclass
+class StageTask:
+    name: str
+    run: Callable[..., object]
+    requires: tuple[str, ...] = ()
+
+
+class StageScheduler:
+    def __init__(self, progress: ProgressCallback | None = None, workers: int = SCHEDULER_WORKERS) -> None:
+        self.progress = progress
+        self.workers = max(workers, 1)
+
+    def run(self, tasks: Sequence[StageTask]) -> dict[str, object]:
+        pending = {task.name: task for task in tasks}
+        results: dict[str, object] = {}
+        if ACTIVE_PROFILER.get() is not None:
+            return self.run_inline(pending, results)
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(pending) or 1)) as pool:
+            running: dict[Future, str] = {}
+            while pending or running:
+                for name, task in list(pending.items()):
+                    if all(required in results for required in task.requires):
+                        del pending[name]
+                        arguments = [results[required] for required in task.requires]
+                        running[pool.submit(copy_context().run, self.execute, task, arguments)] = name
+                if not running:
+                    raise ValueError(f"Etapas com dependencias nao resolvidas: {', '.join(sorted(pending))}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results[running.pop(future)] = future.result()
+        return results
+
+    def run_inline(self, pending: dict[str, StageTask], results: dict[str, object]) -> dict[str, object]:
+        while pending:
+            ready = [task for task in pending.values() if all(required in results for required in task.requires)]
+            if not ready:
+                raise ValueError(f"Etapas com dependencias nao resolvidas: {', '.join(sorted(pending))}")
+            for task in ready:
+                del pending[task.name]
+                results[task.name] = self.execute(task, [results[required] for required in task.requires])
+        return results
+
+    def execute(self, task: StageTask, arguments: list[object]) -> object:
+        with StageProgress(self.progress, task.name), profiled(task.name):
+            return task.run(*arguments)
+
+
+def read_csv_semicolon(uploaded_file: BinaryIO, progress: ProgressCallback | None = None) -> pd.DataFrame:
+    with StageProgress(progress, "reading") as stage:
+        raw = uploaded_file.read()
+        try:
+            uploaded_file.seek(0)
+        except (AttributeError, OSError):
+            pass
+
+        stage.details["bytes"] = len(raw)
+        df = read_csv_bytes(raw)
+        stage.done = stage.total = len(df)
+        METRICS.increment("bytes_read", len(raw))
+        METRICS.increment("rows_read", len(df))
+        return df
 
+
+def read_csv_bytes(raw: bytes) -> pd.DataFrame:
     last_error: Exception | None = None
     for encoding in ("utf-8-sig", "latin1", "cp1252"):
+        METRICS.increment("encoding_attempts")
         try:
             return pd.read_csv(
                 io.BytesIO(raw),
@@ -196,15 +491,17 @@ def read_csv_semicolon_relaxed(raw: bytes, encoding: str) -> pd.DataFrame:
     rows = list(csv.reader(io.StringIO(text), delimiter=";"))
     if not rows:
         return pd.DataFrame()
+    return relaxed_frame(rows[0], rows[1:])
+
 
-    header = rows[0]
+def relaxed_frame(header: list[str], rows: list[list[str]]) -> pd.DataFrame:
     width = len(header)
     is_ledger = [normalize_text(column) for column in header] == [
         normalize_text(column) for column in REQUIRED_LEDGER_COLUMNS
     ]
 
     fixed_rows = []
-    for row in rows[1:]:
+    for row in rows:
         if len(row) < width:
             row = row + [""] * (width - len(row))
         elif len(row) > width:
@@ -218,6 +515,14 @@ def read_csv_semicolon_relaxed(raw: bytes, encoding: str) -> pd.DataFrame:
     return pd.DataFrame(fixed_rows, columns=header).fillna("")
 
 
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def analysis_key(plan_digest: str, ledger_digest: str) -> str:
+    return f"{plan_digest}:{ledger_digest}:{ENGINE_VERSION}"
+
+
 def rename_columns(df: pd.DataFrame, expected: list[str]) -> pd.DataFrame:
     lookup = {normalize_text(column): column for column in df.columns}
     rename_map = {}
@@ -389,7 +694,17 @@ def clean_account_name(name: str) -> str:
     return text
 
 
-def parse_ledger(df: pd.DataFrame) -> pd.DataFrame:
+def parse_ledger(df: pd.DataFrame, progress: ProgressCallback | None = None) -> pd.DataFrame:
+    with StageProgress(progress, "parsing", total=len(df), step=PROGRESS_ROWS_STEP) as stage:
+        ledger = parse_ledger_rows(df, stage)
+        stage.done = len(df)
+        stage.details["daily_entries"] = len(ledger)
+        METRICS.increment("rows_parsed", len(df))
+        METRICS.increment("daily_entries", len(ledger))
+        return ledger
+
+
+def parse_ledger_rows(df: pd.DataFrame, stage: StageProgress) -> pd.DataFrame:
     df = normalize_ledger_columns(df)
     errors = validate_columns(df, REQUIRED_LEDGER_COLUMNS, "Razao")
     if errors:
@@ -407,9 +722,11 @@ def parse_ledger(df: pd.DataFrame) -> pd.DataFrame:
     creditos = df["Cr\u00e9dito"].astype(str).tolist()
     saldos = df["Saldo"].astype(str).tolist()
 
-    for historico_raw, chave, contra, debito_raw, credito_raw, saldo_raw in zip(
-        historicos, chaves, contras, debitos, creditos, saldos
+    for row_number, (historico_raw, chave, contra, debito_raw, credito_raw, saldo_raw) in enumerate(
+        zip(historicos, chaves, contras, debitos, creditos, saldos), 1
     ):
+        if row_number >= stage.next_report:
+            stage.update(row_number)
         historico = historico_raw.strip()
         debito_text = debito_raw.strip()
 
@@ -598,30 +915,37 @@ def movement_impact(row: pd.Series) -> float:
     return 0.0
 
 
-def recalculate_running_balances(result: pd.DataFrame) -> pd.DataFrame:
+def recalculate_running_balances(result: pd.DataFrame, progress: ProgressCallback | None = None) -> pd.DataFrame:
     result = result.copy()
     result["_ordem_original"] = range(len(result))
     result["_impacto"] = result.apply(movement_impact, axis=1)
 
     recalculated: list[pd.Series] = []
-    for _, group in result.groupby(["codigo", "nome_razao"], sort=False):
-        group = group.sort_values(["data", "_ordem_original"]).copy()
-        if group.empty:
-            continue
+    groups = result.groupby(["codigo", "nome_razao"], sort=False)
+    with StageProgress(progress, "running_balances", total=groups.ngroups, step=PROGRESS_ACCOUNTS_STEP) as stage:
+        for account_number, (_, group) in enumerate(groups, 1):
+            stage.update(account_number)
+            recalculate_account_balances(result, group)
+
+    return result.drop(columns=["_ordem_original", "_impacto"])
+
 
-        first = group.iloc[0]
-        initial_balance = float(first["saldo_final_dia"]) - float(first["_impacto"])
-        running_balance = initial_balance
+def recalculate_account_balances(result: pd.DataFrame, group: pd.DataFrame) -> None:
+    group = group.sort_values(["data", "_ordem_original"]).copy()
+    if group.empty:
+        return
 
-        for index, row in group.iterrows():
-            running_balance += float(row["_impacto"])
-            result.at[index, "saldo_final_dia"] = round(running_balance, 2)
-            result.at[index, "Saldo recalculado por movimentos"] = "sim"
+    first = group.iloc[0]
+    initial_balance = float(first["saldo_final_dia"]) - float(first["_impacto"])
+    running_balance = initial_balance
 
-    return result.drop(columns=["_ordem_original", "_impacto"])
+    for index, row in group.iterrows():
+        running_balance += float(row["_impacto"])
+        result.at[index, "saldo_final_dia"] = round(running_balance, 2)
+        result.at[index, "Saldo recalculado por movimentos"] = "sim"
 
 
-def collapse_issue_sequences(output: pd.DataFrame) -> pd.DataFrame:
+def collapse_issue_sequences(output: pd.DataFrame, progress: ProgressCallback | None = None) -> pd.DataFrame:
     if output[output["Tipo de inconsistencia"].ne("")].empty:
         return output[output["Tipo de inconsistencia"].ne("")].copy()
 
@@ -629,136 +953,286 @@ def collapse_issue_sequences(output: pd.DataFrame) -> pd.DataFrame:
     work["_data_dt"] = pd.to_datetime(work["Data"], format="%d/%m/%Y", errors="coerce")
     kept_rows = []
 
-    for _, group in work.sort_values(["Conta analisada", "_data_dt"]).groupby(
+    groups = work.sort_values(["Conta analisada", "_data_dt"]).groupby(
         ["Codigo da conta", "Conta analisada"],
         sort=False,
-    ):
-        sequence_rows = []
-        sequence_type = ""
-
-        def flush_sequence(rows: list[pd.Series]) -> None:
-            if not rows:
-                return
-
-            first = rows[0].copy()
-            first["Dias impactados"] = len(rows)
-            first["Data final da sequencia"] = rows[-1]["Data"]
-            if len(rows) > 1:
-                extra = (
-                    f" Sequencia negativa resumida: {len(rows)} dias impactados, "
-                    f"de {first['Data']} ate {rows[-1]['Data']}."
-                )
-                first["Observacao"] = (str(first.get("Observacao", "")).strip() + extra).strip()
-            kept_rows.append(first)
-
-        for _, row in group.iterrows():
-            issue_type = str(row.get("Tipo de inconsistencia", "")).strip()
-            if not issue_type:
-                flush_sequence(sequence_rows)
-                sequence_rows = []
-                sequence_type = ""
-                continue
+    )
+    with StageProgress(progress, "collapsing", total=groups.ngroups, step=PROGRESS_ACCOUNTS_STEP) as stage:
+        for account_number, (_, group) in enumerate(groups, 1):
+            stage.update(account_number)
+            sequence_rows = []
+            sequence_type = ""
+
+            def flush_sequence(rows: list[pd.Series]) -> None:
+                if not rows:
+                    return
+
+                first = rows[0].copy()
+                first["Dias impactados"] = len(rows)
+                first["Data final da sequencia"] = rows[-1]["Data"]
+                if len(rows) > 1:
+                    extra = (
+                        f" Sequencia negativa resumida: {len(rows)} dias impactados, "
+                        f"de {first['Data']} ate {rows[-1]['Data']}."
+                    )
+                    first["Observacao"] = (str(first.get("Observacao", "")).strip() + extra).strip()
+                kept_rows.append(first)
+
+            for _, row in group.iterrows():
+                issue_type = str(row.get("Tipo de inconsistencia", "")).strip()
+                if not issue_type:
+                    flush_sequence(sequence_rows)
+                    sequence_rows = []
+                    sequence_type = ""
+                    continue
 
-            if sequence_rows and issue_type != sequence_type:
-                flush_sequence(sequence_rows)
-                sequence_rows = []
+                if sequence_rows and issue_type != sequence_type:
+                    flush_sequence(sequence_rows)
+                    sequence_rows = []
 
-            sequence_type = issue_type
-            sequence_rows.append(row)
+                sequence_type = issue_type
+                sequence_rows.append(row)
 
-        flush_sequence(sequence_rows)
+            flush_sequence(sequence_rows)
 
     collapsed = pd.DataFrame(kept_rows).drop(columns=["_data_dt"], errors="ignore")
     return collapsed.reset_index(drop=True)
 
 
-def analyze_balances(ledger_df: pd.DataFrame, plan_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
-    plan = prepare_plan(plan_df)
-    ledger = parse_ledger(ledger_df)
-
+def analyze_balances(
+    ledger_df: pd.DataFrame,
+    plan_df: pd.DataFrame,
+    progress: ProgressCallback | None = None,
+    profiler: Profiler | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    with profiling(profiler, "analyze_balances"):
+        with profiled("plan_prep"):
+            plan = prepare_plan(plan_df)
+        with profiled("parse"):
+            ledger = parse_ledger(ledger_df, progress)
+        return analyze_parsed_ledger(ledger, plan, progress)
+
+
+def analyze_parsed_ledger(
+    ledger: pd.DataFrame,
+    plan: pd.DataFrame,
+    progress: ProgressCallback | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    with StageProgress(progress, "analyzing", total=len(ledger)) as stage:
+        output, inconsistencies = analyze_ledger_entries(ledger, plan, progress)
+        stage.done = len(ledger)
+        stage.details["issues"] = len(inconsistencies)
+        METRICS.increment("analyses")
+        METRICS.increment("issues", len(inconsistencies))
+        return output, inconsistencies
+
+
+def analyze_ledger_entries(
+    ledger: pd.DataFrame,
+    plan: pd.DataFrame,
+    progress: ProgressCallback | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
     if ledger.empty:
         raise ValueError("Nenhum saldo diario foi encontrado no razao informado.")
 
-    result = ledger.merge(
-        plan,
-        left_on="codigo",
-        right_on="codigo_normalizado",
-        how="left",
-        suffixes=("", "_plano"),
-    )
+    with profiled("merge"):
+        result = ledger.merge(
+            plan,
+            left_on="codigo",
+            right_on="codigo_normalizado",
+            how="left",
+            suffixes=("", "_plano"),
+        )
 
-    result["Nome no plano de contas"] = result["Nome"].fillna("")
-    result["Conta encontrada no plano"] = result["codigo_normalizado"].fillna("").ne("")
-    result["Base da natureza"] = result.apply(lambda row: infer_base_nature(row)[0], axis=1)
-    result["Observacao"] = result.apply(lambda row: infer_base_nature(row)[1], axis=1)
-    result["Eh redutora"] = result.apply(is_reducer, axis=1)
-    result["Natureza esperada"] = result.apply(
-        lambda row: invert_nature(row["Base da natureza"]) if row["Eh redutora"] else row["Base da natureza"],
-        axis=1,
-    )
+    with profiled("nature_inference"):
+        result["Nome no plano de contas"] = result["Nome"].fillna("")
+        result["Conta encontrada no plano"] = result["codigo_normalizado"].fillna("").ne("")
+        result["Base da natureza"] = result.apply(lambda row: infer_base_nature(row)[0], axis=1)
+        result["Observacao"] = result.apply(lambda row: infer_base_nature(row)[1], axis=1)
+        result["Eh redutora"] = result.apply(is_reducer, axis=1)
+        result["Natureza esperada"] = result.apply(
+            lambda row: invert_nature(row["Base da natureza"]) if row["Eh redutora"] else row["Base da natureza"],
+            axis=1,
+        )
+
+        missing_plan = ~result["Conta encontrada no plano"]
+        result.loc[missing_plan, "Observacao"] = "Conta nao encontrada no plano de contas."
+        result.loc[missing_plan, "Natureza esperada"] = "indefinida"
+
+    with profiled("running_balances"):
+        result["Saldo recalculado por movimentos"] = "nao"
+        participant_account = result["nome_razao"].map(is_participant_account_name)
+        recalculable = result["Natureza esperada"].isin(["devedora", "credora"]) & participant_account
+        if recalculable.any():
+            recalculated = recalculate_running_balances(result.loc[recalculable].copy(), progress)
+            result.loc[recalculated.index, ["saldo_final_dia", "Saldo recalculado por movimentos"]] = recalculated[
+                ["saldo_final_dia", "Saldo recalculado por movimentos"]
+            ]
+
+    with profiled("issue_typing"):
+        result["Tipo de inconsistencia"] = ""
+        normal_negative_balance = (~result["Eh redutora"]) & (result["saldo_final_dia"] < 0)
+        reducer_positive_balance = result["Eh redutora"] & (result["saldo_final_dia"] > 0)
+        compensation = result["Natureza esperada"].eq("revisao")
+        undefined = result["Natureza esperada"].eq("indefinida")
+
+        result.loc[normal_negative_balance, "Tipo de inconsistencia"] = "Saldo negativo no razao SCI"
+        result.loc[
+            normal_negative_balance & result["Natureza esperada"].eq("credora"),
+            "Tipo de inconsistencia",
+        ] = "Saldo devedor em conta de natureza credora"
+        result.loc[
+            normal_negative_balance & result["Natureza esperada"].eq("devedora"),
+            "Tipo de inconsistencia",
+        ] = "Saldo credor em conta de natureza devedora"
+        result.loc[reducer_positive_balance, "Tipo de inconsistencia"] = "Conta redutora com saldo positivo no razao SCI"
+        result.loc[compensation, "Tipo de inconsistencia"] = "Conta de compensacao para revisao"
+        result.loc[undefined, "Tipo de inconsistencia"] = "Natureza nao identificada"
+
+        needs_negative_review = normal_negative_balance & result["Observacao"].fillna("").eq("")
+        result.loc[needs_negative_review, "Observacao"] = (
+            "O SCI exibiu saldo negativo para esta conta/data. Conferir se o saldo esta invertido."
+        )
+        needs_reducer_review = reducer_positive_balance & result["Observacao"].fillna("").eq("")
+        result.loc[needs_reducer_review, "Observacao"] = (
+            "Conta redutora costuma aparecer negativa no SCI. Conferir saldo positivo nesta data."
+        )
+        output = pd.DataFrame(
+            {
+                "Codigo da conta": result["codigo"],
+                "Conta analisada": result["codigo"] + " - " + result["nome_razao"],
+                "Nome da conta no razao": result["nome_razao"],
+                "Nome no plano de contas": result["Nome no plano de contas"],
+                "Classificacao": result["Classifica\u00e7\u00e3o"].fillna(""),
+                "Grupo": result["Grupo"].fillna(""),
+                "Natureza esperada": result["Natureza esperada"],
+                "Se e redutora": result["Eh redutora"].map({True: "sim", False: "nao"}),
+                "Data": result["data"].dt.strftime("%d/%m/%Y"),
+                "Saldo final do dia": result["saldo_final_dia"],
+                "Lado do saldo": result["lado_saldo"],
+                "Tipo de inconsistencia": result["Tipo de inconsistencia"],
+                "Observacao": result["Observacao"].fillna(""),
+                "Dias impactados": "",
+                "Data final da sequencia": "",
+            }
+        )
 
-    missing_plan = ~result["Conta encontrada no plano"]
-    result.loc[missing_plan, "Observacao"] = "Conta nao encontrada no plano de contas."
-    result.loc[missing_plan, "Natureza esperada"] = "indefinida"
-
-    result["Saldo recalculado por movimentos"] = "nao"
-    participant_account = result["nome_razao"].map(is_participant_account_name)
-    recalculable = result["Natureza esperada"].isin(["devedora", "credora"]) & participant_account
-    if recalculable.any():
-        recalculated = recalculate_running_balances(result.loc[recalculable].copy())
-        result.loc[recalculated.index, ["saldo_final_dia", "Saldo recalculado por movimentos"]] = recalculated[
-            ["saldo_final_dia", "Saldo recalculado por movimentos"]
+    with profiled("collapse"):
+        inconsistencies = collapse_issue_sequences(output, progress)
+    return output, inconsistencies
+
+
+@dataclass
+class BalanceIndex:
+    accounts: dict[str, int]
+    offsets: np.ndarray
+    days: np.ndarray
+    balances: np.ndarray
+    labels: np.ndarray
+    keys: np.ndarray
+    base_day: int
+    stride: int
+
+    @classmethod
+    def empty(cls) -> BalanceIndex:
+        return cls(
+            accounts={},
+            offsets=np.zeros(1, dtype=np.int64),
+            days=np.zeros(0, dtype=np.int64),
+            balances=np.zeros(0, dtype=np.float64),
+            labels=np.zeros(0, dtype=object),
+            keys=np.zeros(0, dtype=np.int64),
+            base_day=0,
+            stride=1,
+        )
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.offsets, self.days, self.balances, self.keys]
+        labels = int(pd.Series(self.labels, dtype=object).memory_usage(deep=True, index=False))
+        return sum(array.nbytes for array in arrays) + labels
+
+    def bounds(self, account: str) -> tuple[int, int] | None:
+        position = self.accounts.get(str(account))
+        if position is None:
+            return None
+        return int(self.offsets[position]), int(self.offsets[position + 1])
+
+    def locate(self, accounts: Sequence[object]) -> np.ndarray:
+        return np.fromiter(
+            (self.accounts.get(str(account), -1) for account in accounts),
+            dtype=np.int64,
+            count=len(accounts),
+        )
+
+    def keys_for(self, positions: np.ndarray, days: np.ndarray) -> np.ndarray:
+        clipped = np.clip(days, self.base_day, self.base_day + self.stride - 1)
+        return positions * self.stride + clipped - self.base_day
+
+    def windows(self, positions: np.ndarray, start_days: np.ndarray, end_days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        lo = np.searchsorted(self.keys, self.keys_for(positions, start_days), side="left")
+        hi = np.searchsorted(self.keys, self.keys_for(positions, end_days), side="right")
+        return lo, np.maximum(lo, hi)
+
+    def tail(self, account: str, count: int) -> slice:
+        bounds = self.bounds(account)
+        if bounds is None:
+            return slice(0, 0)
+        lo, hi = bounds
+        return slice(max(lo, hi - count), hi)
+
+    def points(self, window: slice) -> list[dict[str, object]]:
+        return [
+            {"data": label, "saldo": float(balance)}
+            for label, balance in zip(self.labels[window].tolist(), self.balances[window].tolist())
         ]
 
-    result["Tipo de inconsistencia"] = ""
-    normal_negative_balance = (~result["Eh redutora"]) & (result["saldo_final_dia"] < 0)
-    reducer_positive_balance = result["Eh redutora"] & (result["saldo_final_dia"] > 0)
-    compensation = result["Natureza esperada"].eq("revisao")
-    undefined = result["Natureza esperada"].eq("indefinida")
-
-    result.loc[normal_negative_balance, "Tipo de inconsistencia"] = "Saldo negativo no razao SCI"
-    result.loc[
-        normal_negative_balance & result["Natureza esperada"].eq("credora"),
-        "Tipo de inconsistencia",
-    ] = "Saldo devedor em conta de natureza credora"
-    result.loc[
-        normal_negative_balance & result["Natureza esperada"].eq("devedora"),
-        "Tipo de inconsistencia",
-    ] = "Saldo credor em conta de natureza devedora"
-    result.loc[reducer_positive_balance, "Tipo de inconsistencia"] = "Conta redutora com saldo positivo no razao SCI"
-    result.loc[compensation, "Tipo de inconsistencia"] = "Conta de compensacao para revisao"
-    result.loc[undefined, "Tipo de inconsistencia"] = "Natureza nao identificada"
-
-    needs_negative_review = normal_negative_balance & result["Observacao"].fillna("").eq("")
-    result.loc[needs_negative_review, "Observacao"] = (
-        "O SCI exibiu saldo negativo para esta conta/data. Conferir se o saldo esta invertido."
+    def dates(self, window: slice) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.days[window].astype("datetime64[D]"))
+
+
+def day_ordinals(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    dates = pd.to_datetime(values, format="%d/%m/%Y", errors="coerce")
+    valid = dates.notna().to_numpy()
+    days = np.zeros(len(dates), dtype=np.int64)
+    days[valid] = dates.to_numpy()[valid].astype("datetime64[D]").astype(np.int64)
+    return days, valid
+
+
+def build_balance_index(result: pd.DataFrame) -> BalanceIndex:
+    if result.empty:
+        return BalanceIndex.empty()
+
+    days, valid = day_ordinals(result["Data"])
+    if not valid.any():
+        return BalanceIndex.empty()
+
+    days = days[valid]
+    balances = pd.to_numeric(result["Saldo final do dia"], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)[valid]
+    labels = result["Data"].to_numpy(dtype=object)[valid]
+    codes, uniques = pd.factorize(result["Conta analisada"].astype(str).to_numpy()[valid])
+
+    order = np.lexsort((days, codes))
+    codes = codes[order]
+    days = days[order]
+    counts = np.bincount(codes, minlength=len(uniques))
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    base_day = int(days.min()) - 1
+    stride = int(days.max()) - base_day + 2
+    return BalanceIndex(
+        accounts={str(account): position for position, account in enumerate(uniques)},
+        offsets=offsets,
+        days=days,
+        balances=balances[order],
+        labels=labels[order],
+        keys=codes.astype(np.int64) * stride + (days - base_day),
+        base_day=base_day,
+        stride=stride,
     )
-    needs_reducer_review = reducer_positive_balance & result["Observacao"].fillna("").eq("")
-    result.loc[needs_reducer_review, "Observacao"] = (
-        "Conta redutora costuma aparecer negativa no SCI. Conferir saldo positivo nesta data."
-    )
-    output = pd.DataFrame(
-        {
-            "Codigo da conta": result["codigo"],
-            "Conta analisada": result["codigo"] + " - " + result["nome_razao"],
-            "Nome da conta no razao": result["nome_razao"],
-            "Nome no plano de contas": result["Nome no plano de contas"],
-            "Classificacao": result["Classifica\u00e7\u00e3o"].fillna(""),
-            "Grupo": result["Grupo"].fillna(""),
-            "Natureza esperada": result["Natureza esperada"],
-            "Se e redutora": result["Eh redutora"].map({True: "sim", False: "nao"}),
-            "Data": result["data"].dt.strftime("%d/%m/%Y"),
-            "Saldo final do dia": result["saldo_final_dia"],
-            "Lado do saldo": result["lado_saldo"],
-            "Tipo de inconsistencia": result["Tipo de inconsistencia"],
-            "Observacao": result["Observacao"].fillna(""),
-            "Dias impactados": "",
-            "Data final da sequencia": "",
-        }
-    )
-
-    inconsistencies = collapse_issue_sequences(output)
-    return output, inconsistencies
 
 
 AZUL_ESCURO = "1F3864"
@@ -783,13 +1257,6 @@ def borda_media():
     return Border(left=s, right=s, top=s, bottom=s)
 
 
-def estilo_cabecalho(cell, bg=AZUL_ESCURO, fg=BRANCO):
-    cell.font = Font(name="Arial", bold=True, color=fg, size=9)
-    cell.fill = PatternFill("solid", fgColor=bg)
-    cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    cell.border = borda_fina()
-
-
 def issue_fill(value: object) -> str:
     text = normalize_text(value)
     if "credor em conta de natureza devedora" in text:
@@ -819,204 +1286,406 @@ def safe_days(value: object) -> int:
         return 1
 
 
-def dataframe_to_excel(df: pd.DataFrame) -> bytes:
-    df = df.copy()
-    if "Dias impactados" not in df.columns:
-        df["Dias impactados"] = 1
-    df["Dias impactados"] = df["Dias impactados"].map(safe_days)
-    df["Saldo final do dia"] = pd.to_numeric(df.get("Saldo final do dia", 0), errors="coerce").fillna(0)
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    compact = df.copy()
+    for column in compact.columns:
+        if not pd.api.types.is_numeric_dtype(compact[column]):
+            compact[column] = compact[column].astype("category")
+    return compact
 
-    buffer = io.BytesIO()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Resumo Executivo"
-    ws.sheet_view.showGridLines = False
-    build_excel_summary(ws, df)
 
-    detail = wb.create_sheet("Detalhamento")
-    detail.sheet_view.showGridLines = False
-    build_excel_detail(detail, df)
+def columnar_export_available() -> bool:
+    return pa is not None
+
 
-    by_account = wb.create_sheet("Por Conta")
-    by_account.sheet_view.showGridLines = False
-    build_excel_by_account(by_account, df)
+def write_csv(df: pd.DataFrame, target: BinaryIO, decimal: str = ".") -> None:
+    with StageProgress(None, "csv_export", total=len(df)):
+        for start in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+            chunk = df.iloc[start : start + EXPORT_CHUNK_ROWS]
+            text = chunk.to_csv(sep=";", decimal=decimal, index=False, header=start == 0, lineterminator="\n")
+            target.write(text.encode("utf-8"))
+    METRICS.increment("csv_rows_written", len(df))
 
-    wb.save(buffer)
+
+def write_columnar(df: pd.DataFrame, target: BinaryIO, file_format: str) -> None:
+    if pa is None:
+        raise RuntimeError("Exportacao em Parquet ou Feather requer o pacote pyarrow")
+    schema = columnar_schema(df)
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(target, schema)
+    else:
+        writer = pa.ipc.new_file(target, schema)
+    with StageProgress(None, f"{file_format}_export", total=len(df)):
+        with writer:
+            for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+                chunk = df.iloc[start : start + EXPORT_CHUNK_ROWS]
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    METRICS.increment("columnar_rows_written", len(df))
+
+
+def columnar_schema(df: pd.DataFrame) -> pa.Schema:
+    schema = pa.Schema.from_pandas(df.head(EXPORT_CHUNK_ROWS), preserve_index=False)
+    for position, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(position, field.with_type(pa.string()))
+    return schema
+
+
+def dataframe_to_excel(df: pd.DataFrame, profiler: Profiler | None = None) -> bytes:
+    buffer = io.BytesIO()
+    write_excel(df, buffer, profiler)
     return buffer.getvalue()
 
 
-def build_excel_summary(ws, df: pd.DataFrame) -> None:
-    widths = {"A": 2, "B": 24, "C": 16, "D": 24, "E": 16, "F": 24, "G": 16, "H": 2}
-    for col, width in widths.items():
-        ws.column_dimensions[col].width = width
+def write_excel(df: pd.DataFrame, target: BinaryIO, profiler: Profiler | None = None) -> None:
+    with profiling(profiler, "dataframe_to_excel"), StageProgress(None, "excel", total=len(df)):
+        with profiled("excel_prepare"):
+            df = df.copy()
+            if "Dias impactados" not in df.columns:
+                df["Dias impactados"] = 1
+            df["Dias impactados"] = df["Dias impactados"].map(safe_days)
+            df["Saldo final do dia"] = pd.to_numeric(df.get("Saldo final do dia", 0), errors="coerce").fillna(0)
+            cube = build_excel_cube(df)
 
-    ws.merge_cells("B2:G2")
-    ws["B2"] = "ANALISE DE SALDOS DIARIOS - SCI"
-    ws["B2"].font = Font(name="Arial", bold=True, color=BRANCO, size=16)
-    ws["B2"].fill = PatternFill("solid", fgColor=AZUL_ESCURO)
-    ws["B2"].alignment = Alignment(horizontal="center", vertical="center")
-    ws.row_dimensions[2].height = 38
+        wb = Workbook(write_only=True)
+        styles = ExcelStyles(wb)
 
-    ws.merge_cells("B3:G3")
-    ws["B3"] = "Inconsistencias identificadas no sistema contabil"
-    ws["B3"].font = Font(name="Arial", italic=True, color=AZUL_MED, size=9)
-    ws["B3"].fill = PatternFill("solid", fgColor=AZUL_CLARO)
-    ws["B3"].alignment = Alignment(horizontal="center", vertical="center")
-    ws.row_dimensions[3].height = 20
+        ws = wb.create_sheet("Resumo Executivo")
+        ws.sheet_view.showGridLines = False
+        with profiled("excel_summary"):
+            build_excel_summary(ws, cube, styles)
 
-    cards = [
-        ("B", "C", "Total de Ocorrencias", len(df), "registros", VERMELHO_BG, VERMELHO_FG),
-        ("D", "E", "Contas Analisadas", df["Codigo da conta"].nunique() if not df.empty else 0, "contas", AZUL_CLARO, AZUL_MED),
-        ("F", "G", "Dias Impactados", int(df["Dias impactados"].sum()) if not df.empty else 0, "dias acumulados", AMARELO_BG, AMARELO_FG),
-    ]
-    for start_col, end_col, label, value, unit, fill, fg in cards:
-        for row, text, size, bold in [(6, label, 9, True), (7, value, 24, True), (8, unit, 8, False)]:
-            ws.merge_cells(f"{start_col}{row}:{end_col}{row}")
-            cell = ws[f"{start_col}{row}"]
-            cell.value = text
-            cell.fill = PatternFill("solid", fgColor=fill)
-            cell.font = Font(name="Arial", bold=bold, color=fg, size=size)
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-            cell.border = borda_media()
-        ws.row_dimensions[6].height = 22
-        ws.row_dimensions[7].height = 28
-        ws.row_dimensions[8].height = 22
+        with profiled("excel_detail"):
+            build_excel_detail(wb, cube, styles)
 
-    row = 12
-    row = add_distribution_section(ws, df, row, "DISTRIBUICAO POR TIPO DE INCONSISTENCIA", "Tipo de inconsistencia")
-    row += 2
-    add_distribution_section(ws, df, row, "DISTRIBUICAO POR GRUPO CONTABIL", "Grupo", by_group=True)
+        by_account = wb.create_sheet("Por Conta")
+        by_account.sheet_view.showGridLines = False
+        with profiled("excel_by_account"):
+            build_excel_by_account(by_account, cube, styles)
 
+        with profiled("excel_save"):
+            wb.save(target)
+        METRICS.increment("excel_exports")
+        METRICS.increment("excel_rows_written", styles.rows_written)
 
-def add_distribution_section(ws, df: pd.DataFrame, start_row: int, title: str, group_col: str, by_group: bool = False) -> int:
-    ws.merge_cells(start_row=start_row, start_column=2, end_row=start_row, end_column=7)
-    cell = ws.cell(start_row, 2, title)
-    estilo_cabecalho(cell, AZUL_MED)
-    ws.row_dimensions[start_row].height = 22
-    headers = ["Tipo" if not by_group else "Grupo", "Ocorrencias", "Dias Impactados", "Maior Saldo (R$)", "Contas", "% Total"]
-    for col, header in enumerate(headers, 2):
-        estilo_cabecalho(ws.cell(start_row + 1, col, header), AZUL_ESCURO)
 
-    if df.empty or group_col not in df.columns:
-        return start_row + 2
+@dataclass
+class ExcelCube:
+    rows: int
+    accounts: int
+    days: int
+    max_balance: float
+    by_type: pd.DataFrame | None
+    by_group: pd.DataFrame | None
+    by_account: pd.DataFrame | None
+    detail: pd.DataFrame
+
+
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_BLOCK_ROWS = 50_000
+EXCEL_CUBE_KEYS = ["Codigo da conta", "Nome da conta no razao", "Grupo", "Tipo de inconsistencia"]
+
+
+def build_excel_cube(df: pd.DataFrame) -> ExcelCube:
+    cube = ExcelCube(
+        rows=len(df),
+        accounts=df["Codigo da conta"].nunique() if not df.empty else 0,
+        days=int(df["Dias impactados"].sum()) if not df.empty else 0,
+        max_balance=float(df["Saldo final do dia"].abs().max()) if not df.empty else 0.0,
+        by_type=None,
+        by_group=None,
+        by_account=None,
+        detail=df,
+    )
+    if df.empty:
+        return cube
 
-    grouped = (
-        df.groupby(group_col)
+    keys = [column for column in EXCEL_CUBE_KEYS if column in df.columns]
+    tasks = [
+        StageTask("excel_cube_detail", lambda: df.sort_values(["Grupo", "Codigo da conta", "Data"])),
+        StageTask("excel_cube_cells", lambda: aggregate_excel_cells(df, keys)),
+    ]
+    if "Tipo de inconsistencia" in keys:
+        tasks.append(StageTask("excel_cube_by_type", lambda cells: distribution_from_cube(cells, "Tipo de inconsistencia"), ("excel_cube_cells",)))
+    if "Grupo" in keys:
+        tasks.append(StageTask("excel_cube_by_group", lambda cells: distribution_from_cube(cells, "Grupo"), ("excel_cube_cells",)))
+    if len(keys) == len(EXCEL_CUBE_KEYS):
+        tasks.append(StageTask("excel_cube_by_account", accounts_from_cube, ("excel_cube_cells",)))
+
+    results = StageScheduler().run(tasks)
+    cube.detail = results["excel_cube_detail"]
+    cube.by_type = results.get("excel_cube_by_type")
+    cube.by_group = results.get("excel_cube_by_group")
+    cube.by_account = results.get("excel_cube_by_account")
+    return cube
+
+
+def aggregate_excel_cells(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    return (
+        df.assign(_saldo=df["Saldo final do dia"].abs())
+        .groupby(keys, dropna=False)
         .agg(
             ocorrencias=("Data", "count"),
+            linhas=("Data", "size"),
             dias=("Dias impactados", "sum"),
-            saldo=("Saldo final do dia", lambda s: abs(s).max()),
+            saldo=("_saldo", "max"),
+        )
+        .reset_index()
+    )
+
+
+def distribution_from_cube(cells: pd.DataFrame, column: str) -> pd.DataFrame:
+    return (
+        cells.groupby(column)
+        .agg(
+            ocorrencias=("ocorrencias", "sum"),
+            dias=("dias", "sum"),
+            saldo=("saldo", "max"),
             contas=("Codigo da conta", "nunique"),
         )
         .sort_values("ocorrencias", ascending=False)
     )
-    total = max(len(df), 1)
+
+
+def accounts_from_cube(cells: pd.DataFrame) -> pd.DataFrame:
+    account_keys = EXCEL_CUBE_KEYS[:3]
+    grouped = cells.groupby(account_keys).agg(
+        ocorrencias=("ocorrencias", "sum"),
+        dias=("dias", "sum"),
+        saldo=("saldo", "max"),
+    )
+    main_types = (
+        cells.dropna(subset=["Tipo de inconsistencia"])
+        .sort_values(["linhas", "Tipo de inconsistencia"], ascending=[False, True], kind="stable")
+        .drop_duplicates(subset=account_keys)
+        .set_index(account_keys)["Tipo de inconsistencia"]
+    )
+    grouped["tipo"] = main_types.reindex(grouped.index).fillna("")
+    return grouped.reset_index().sort_values("ocorrencias", ascending=False)
+
+
+class ExcelStyles:
+    def __init__(self, wb: Workbook) -> None:
+        self.wb = wb
+        self.sheet_rows: dict[str, int] = {}
+        self.rows_written = 0
+        for fill in (VERMELHO_BG, AMARELO_BG, VERDE_BG, CINZA_LINHA):
+            for kind in ("left", "wrap", "center", "money", "money_right", "percent"):
+                self.register(data_style(kind, fill))
+        for kind in ("center", "money", "percent"):
+            self.register(data_style(kind, AZUL_ESCURO, bold=True, color=BRANCO))
+        for bg in (AZUL_ESCURO, AZUL_MED):
+            self.register(header_style(bg))
+        self.register(header_style(AZUL_ESCURO, size=13, name="ac_titulo"))
+
+    def register(self, style: NamedStyle) -> None:
+        self.wb.add_named_style(style)
+
+    def cell(self, ws, value: object, name: str) -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value)
+        cell.style = name
+        return cell
+
+    def append(self, ws, row: list[object]) -> None:
+        ws.append(row)
+        self.sheet_rows[ws.title] = self.sheet_rows.get(ws.title, 0) + 1
+        self.rows_written += 1
+
+    def skip_to(self, ws, row: int) -> None:
+        while self.sheet_rows.get(ws.title, 0) < row - 1:
+            self.append(ws, [])
+
+
+def data_style(kind: str, fill: str, bold: bool = False, color: str | None = None) -> NamedStyle:
+    horizontal = {"left": "left", "wrap": "left", "money_right": "right"}.get(kind, "center")
+    style = NamedStyle(name=excel_style_name(kind, fill))
+    style.font = Font(name="Arial", size=9, bold=bold, color=color)
+    style.fill = PatternFill("solid", fgColor=fill)
+    style.border = borda_fina()
+    style.alignment = Alignment(horizontal=horizontal, vertical="center", wrap_text=kind == "wrap")
+    if kind in {"money", "money_right"}:
+        style.number_format = "#,##0.00"
+    elif kind == "percent":
+        style.number_format = "0.0%"
+    return style
+
+
+def header_style(bg: str, size: int = 9, name: str = "") -> NamedStyle:
+    style = NamedStyle(name=name or f"ac_cabecalho_{bg}")
+    style.font = Font(name="Arial", bold=True, color=BRANCO, size=size)
+    style.fill = PatternFill("solid", fgColor=bg)
+    style.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    style.border = borda_fina()
+    return style
+
+
+def excel_style_name(kind: str, fill: str) -> str:
+    return f"ac_{kind}_{fill}"
+
+
+def column_values(df: pd.DataFrame, column: str, default: object = "") -> list[object]:
+    if column in df.columns:
+        return df[column].tolist()
+    return [default] * len(df)
+
+
+def write_title(ws, styles: ExcelStyles, title: str, columns: int) -> None:
+    ws.row_dimensions[1].height = 36
+    ws.merged_cells.add(f"A1:{get_column_letter(columns)}1")
+    styles.append(ws, [styles.cell(ws, title, "ac_titulo")] + [styles.cell(ws, None, "ac_titulo") for _ in range(columns - 1)])
+
+
+def write_headers(ws, styles: ExcelStyles, headers: list[str], first_column: int = 1, bg: str = AZUL_MED) -> None:
+    name = f"ac_cabecalho_{bg}"
+    styles.append(ws, [None] * (first_column - 1) + [styles.cell(ws, header, name) for header in headers])
+
+
+def build_excel_summary(ws, cube: ExcelCube, styles: ExcelStyles) -> None:
+    widths = {"A": 2, "B": 24, "C": 16, "D": 24, "E": 16, "F": 24, "G": 16, "H": 2}
+    for col, width in widths.items():
+        ws.column_dimensions[col].width = width
+    for row, height in {2: 38, 3: 20, 6: 22, 7: 28, 8: 22}.items():
+        ws.row_dimensions[row].height = height
+
+    styles.skip_to(ws, 2)
+    ws.merged_cells.add("B2:G2")
+    title = WriteOnlyCell(ws, "ANALISE DE SALDOS DIARIOS - SCI")
+    title.font = Font(name="Arial", bold=True, color=BRANCO, size=16)
+    title.fill = PatternFill("solid", fgColor=AZUL_ESCURO)
+    title.alignment = Alignment(horizontal="center", vertical="center")
+    styles.append(ws, [None, title])
+
+    ws.merged_cells.add("B3:G3")
+    subtitle = WriteOnlyCell(ws, "Inconsistencias identificadas no sistema contabil")
+    subtitle.font = Font(name="Arial", italic=True, color=AZUL_MED, size=9)
+    subtitle.fill = PatternFill("solid", fgColor=AZUL_CLARO)
+    subtitle.alignment = Alignment(horizontal="center", vertical="center")
+    styles.append(ws, [None, subtitle])
+    styles.skip_to(ws, 6)
+
+    cards = [
+        ("Total de Ocorrencias", cube.rows, "registros", VERMELHO_BG, VERMELHO_FG),
+        ("Contas Analisadas", cube.accounts, "contas", AZUL_CLARO, AZUL_MED),
+        ("Dias Impactados", cube.days, "dias acumulados", AMARELO_BG, AMARELO_FG),
+    ]
+    for line, (position, size, bold) in enumerate([(0, 9, True), (1, 24, True), (2, 8, False)], 6):
+        row: list[object] = [None]
+        for column, card in enumerate(cards):
+            start = 2 + column * 2
+            ws.merged_cells.add(f"{get_column_letter(start)}{line}:{get_column_letter(start + 1)}{line}")
+            label, value, unit, fill, fg = card
+            for text in ((label, value, unit)[position], None):
+                cell = WriteOnlyCell(ws, text)
+                cell.border = borda_media()
+                if text is not None:
+                    cell.fill = PatternFill("solid", fgColor=fill)
+                    cell.font = Font(name="Arial", bold=bold, color=fg, size=size)
+                    cell.alignment = Alignment(horizontal="center", vertical="center")
+                row.append(cell)
+        styles.append(ws, row)
+
+    row = 12
+    row = add_distribution_section(ws, cube, cube.by_type, row, "DISTRIBUICAO POR TIPO DE INCONSISTENCIA", styles)
+    row += 2
+    add_distribution_section(ws, cube, cube.by_group, row, "DISTRIBUICAO POR GRUPO CONTABIL", styles, by_group=True)
+
+
+def add_distribution_section(
+    ws,
+    cube: ExcelCube,
+    grouped: pd.DataFrame | None,
+    start_row: int,
+    title: str,
+    styles: ExcelStyles,
+    by_group: bool = False,
+) -> int:
+    styles.skip_to(ws, start_row)
+    ws.row_dimensions[start_row].height = 22
+    ws.merged_cells.add(f"B{start_row}:G{start_row}")
+    header = f"ac_cabecalho_{AZUL_MED}"
+    styles.append(ws, [None, styles.cell(ws, title, header)] + [styles.cell(ws, None, header) for _ in range(5)])
+    headers = ["Tipo" if not by_group else "Grupo", "Ocorrencias", "Dias Impactados", "Maior Saldo (R$)", "Contas", "% Total"]
+    write_headers(ws, styles, headers, first_column=2, bg=AZUL_ESCURO)
+
+    if grouped is None:
+        return start_row + 2
+
+    total = max(cube.rows, 1)
     row = start_row + 2
+    kinds = ["left", "center", "center", "money", "center", "percent"]
     for name, data in grouped.iterrows():
         fill = group_fill(name) if by_group else issue_fill(name)
         values = [name, int(data["ocorrencias"]), int(data["dias"]), float(data["saldo"]), int(data["contas"]), float(data["ocorrencias"]) / total]
-        for col, value in enumerate(values, 2):
-            cell = ws.cell(row, col, value)
-            cell.fill = PatternFill("solid", fgColor=fill)
-            cell.border = borda_fina()
-            cell.font = Font(name="Arial", size=9)
-            cell.alignment = Alignment(horizontal="left" if col == 2 else "center", vertical="center")
-            if col == 5:
-                cell.number_format = "#,##0.00"
-            if col == 7:
-                cell.number_format = "0.0%"
+        styles.append(ws, [None] + [styles.cell(ws, value, excel_style_name(kind, fill)) for value, kind in zip(values, kinds)])
         row += 1
 
-    totals = ["TOTAL", len(df), int(df["Dias impactados"].sum()), float(abs(df["Saldo final do dia"]).max() if not df.empty else 0), df["Codigo da conta"].nunique(), 1]
-    for col, value in enumerate(totals, 2):
-        cell = ws.cell(row, col, value)
-        cell.fill = PatternFill("solid", fgColor=AZUL_ESCURO)
-        cell.font = Font(name="Arial", bold=True, color=BRANCO, size=9)
-        cell.border = borda_fina()
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        if col == 5:
-            cell.number_format = "#,##0.00"
-        if col == 7:
-            cell.number_format = "0.0%"
+    totals = ["TOTAL", cube.rows, cube.days, cube.max_balance, cube.accounts, 1]
+    total_kinds = ["center", "center", "center", "money", "center", "percent"]
+    styles.append(ws, [None] + [styles.cell(ws, value, excel_style_name(kind, AZUL_ESCURO)) for value, kind in zip(totals, total_kinds)])
     return row
 
 
-def build_excel_detail(ws, df: pd.DataFrame) -> None:
+def build_excel_detail(wb: Workbook, cube: ExcelCube, styles: ExcelStyles) -> None:
+    sheet_rows = EXCEL_MAX_ROWS - 2
+    fills: dict[str, str] = {}
+    for number, start in enumerate(range(0, max(len(cube.detail), 1), sheet_rows), start=1):
+        ws = wb.create_sheet("Detalhamento" if number == 1 else f"Detalhamento ({number})")
+        ws.sheet_view.showGridLines = False
+        part = cube.detail.iloc[start:start + sheet_rows]
+        start_excel_detail(ws, styles, len(part))
+        for offset in range(0, len(part), EXCEL_BLOCK_ROWS):
+            write_excel_detail_rows(ws, part.iloc[offset:offset + EXCEL_BLOCK_ROWS], styles, fills)
+
+
+def start_excel_detail(ws, styles: ExcelStyles, rows: int) -> None:
     widths = {"A": 8, "B": 30, "C": 12, "D": 10, "E": 12, "F": 15, "G": 10, "H": 45, "I": 8, "J": 14}
     for col, width in widths.items():
         ws.column_dimensions[col].width = width
-    ws.merge_cells("A1:J1")
-    ws["A1"] = "ANALISE DE SALDOS DIARIOS - DETALHAMENTO COMPLETO"
-    estilo_cabecalho(ws["A1"], AZUL_ESCURO)
-    ws["A1"].font = Font(name="Arial", bold=True, color=BRANCO, size=13)
-    ws.row_dimensions[1].height = 36
-    headers = ["Codigo", "Conta", "Grupo", "Natureza", "Data", "Saldo (R$)", "Dias Impact.", "Tipo de Inconsistencia", "Seq.", "Dt. Final Seq."]
-    for col, header in enumerate(headers, 1):
-        estilo_cabecalho(ws.cell(2, col, header), AZUL_MED)
-
-    ordered = df.sort_values(["Grupo", "Codigo da conta", "Data"]) if not df.empty else df
-    for row_idx, (_, row) in enumerate(ordered.iterrows(), 3):
-        values = [
-            row.get("Codigo da conta", ""),
-            row.get("Nome da conta no razao", ""),
-            row.get("Grupo", ""),
-            row.get("Natureza esperada", ""),
-            row.get("Data", ""),
-            abs(float(row.get("Saldo final do dia", 0))),
-            safe_days(row.get("Dias impactados", 1)),
-            row.get("Tipo de inconsistencia", ""),
-            "sim" if safe_days(row.get("Dias impactados", 1)) > 1 else "",
-            row.get("Data final da sequencia", ""),
-        ]
-        fill = issue_fill(row.get("Tipo de inconsistencia", ""))
-        for col, value in enumerate(values, 1):
-            cell = ws.cell(row_idx, col, value)
-            cell.fill = PatternFill("solid", fgColor=fill)
-            cell.border = borda_fina()
-            cell.font = Font(name="Arial", size=9)
-            cell.alignment = Alignment(horizontal="left" if col in {2, 8} else "center", vertical="center", wrap_text=col in {2, 8})
-            if col == 6:
-                cell.number_format = "#,##0.00"
-                cell.alignment = Alignment(horizontal="right", vertical="center")
-        ws.row_dimensions[row_idx].height = 17
     ws.freeze_panes = "A3"
-    ws.auto_filter.ref = f"A2:J{max(2, len(ordered) + 2)}"
+    ws.auto_filter.ref = f"A2:J{max(2, rows + 2)}"
+    ws.sheet_format.defaultRowHeight = 17
+    ws.sheet_format.customHeight = True
 
+    write_title(ws, styles, "ANALISE DE SALDOS DIARIOS - DETALHAMENTO COMPLETO", 10)
+    headers = ["Codigo", "Conta", "Grupo", "Natureza", "Data", "Saldo (R$)", "Dias Impact.", "Tipo de Inconsistencia", "Seq.", "Dt. Final Seq."]
+    write_headers(ws, styles, headers)
+
+
+def write_excel_detail_rows(ws, ordered: pd.DataFrame, styles: ExcelStyles, fills: dict[str, str]) -> None:
+    days = [safe_days(value) for value in column_values(ordered, "Dias impactados", 1)]
+    issue_types = column_values(ordered, "Tipo de inconsistencia")
+    columns = zip(
+        column_values(ordered, "Codigo da conta"),
+        column_values(ordered, "Nome da conta no razao"),
+        column_values(ordered, "Grupo"),
+        column_values(ordered, "Natureza esperada"),
+        column_values(ordered, "Data"),
+        [abs(float(value)) for value in column_values(ordered, "Saldo final do dia", 0)],
+        days,
+        issue_types,
+        ["sim" if value > 1 else "" for value in days],
+        column_values(ordered, "Data final da sequencia"),
+    )
+    kinds = ["center", "wrap", "center", "center", "center", "money_right", "center", "wrap", "center", "center"]
+    for values, issue_type in zip(columns, issue_types):
+        fill = fills.get(issue_type)
+        if fill is None:
+            fill = fills[issue_type] = issue_fill(issue_type)
+        names = [excel_style_name(kind, fill) for kind in kinds]
+        styles.append(ws, [styles.cell(ws, value, name) for value, name in zip(values, names)])
 
-def build_excel_by_account(ws, df: pd.DataFrame) -> None:
+
+def build_excel_by_account(ws, cube: ExcelCube, styles: ExcelStyles) -> None:
     widths = {"A": 8, "B": 34, "C": 14, "D": 12, "E": 16, "F": 15, "G": 42}
     for col, width in widths.items():
         ws.column_dimensions[col].width = width
-    ws.merge_cells("A1:G1")
-    ws["A1"] = "ANALISE DE SALDOS DIARIOS - CONSOLIDADO POR CONTA"
-    estilo_cabecalho(ws["A1"], AZUL_ESCURO)
-    ws["A1"].font = Font(name="Arial", bold=True, color=BRANCO, size=13)
-    ws.row_dimensions[1].height = 36
+    write_title(ws, styles, "ANALISE DE SALDOS DIARIOS - CONSOLIDADO POR CONTA", 7)
     headers = ["Codigo", "Conta", "Grupo", "Ocorrencias", "Total Dias Impact.", "Maior Saldo (R$)", "Tipo Principal"]
-    for col, header in enumerate(headers, 1):
-        estilo_cabecalho(ws.cell(2, col, header), AZUL_MED)
-    if df.empty:
+    write_headers(ws, styles, headers)
+    if cube.by_account is None:
         return
-    grouped = (
-        df.groupby(["Codigo da conta", "Nome da conta no razao", "Grupo"])
-        .agg(
-            ocorrencias=("Data", "count"),
-            dias=("Dias impactados", "sum"),
-            saldo=("Saldo final do dia", lambda s: abs(s).max()),
-            tipo=("Tipo de inconsistencia", lambda s: s.mode().iloc[0] if not s.mode().empty else ""),
-        )
-        .reset_index()
-        .sort_values("ocorrencias", ascending=False)
-    )
-    for row_idx, (_, row) in enumerate(grouped.iterrows(), 3):
-        values = [row["Codigo da conta"], row["Nome da conta no razao"], row["Grupo"], int(row["ocorrencias"]), int(row["dias"]), float(row["saldo"]), row["tipo"]]
-        fill = group_fill(row["Grupo"])
-        for col, value in enumerate(values, 1):
-            cell = ws.cell(row_idx, col, value)
-            cell.fill = PatternFill("solid", fgColor=fill)
-            cell.border = borda_fina()
-            cell.font = Font(name="Arial", size=9)
-            cell.alignment = Alignment(horizontal="left" if col in {2, 7} else "center", vertical="center", wrap_text=col in {2, 7})
-            if col == 6:
-                cell.number_format = "#,##0.00"
-
+    kinds = ["center", "wrap", "center", "center", "center", "money", "wrap"]
+    for row in cube.by_account.itertuples(index=False):
+        values = [row[0], row[1], row[2], int(row.ocorrencias), int(row.dias), float(row.saldo), row.tipo]
+        fill = group_fill(row[2])
+        styles.append(ws, [styles.cell(ws, value, excel_style_name(kind, fill)) for value, kind in zip(values, kinds)])
@@ -1,18 +1,59 @@
 from __future__ import annotations
 
 import base64
+import io
+import os
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-from core import analyze_balances, dataframe_to_excel, read_csv_semicolon
+from core import (
+    ENGINE_VERSION,
+    BalanceIndex,
+    analysis_key,
+    analyze_balances,
+    build_balance_index,
+    content_digest,
+    dataframe_to_excel,
+    normalize_text,
+    read_csv_semicolon,
+)
 
 
 APP_DIR = Path(__file__).parent
 LOGO_PATH = APP_DIR / "logo_analisador_contabil.svg"
+ANALYSIS_CACHE_ENTRIES = 8
+UPLOAD_CACHE_ENTRIES = 4
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get("ANALISADOR_CACHE_ARQUIVO_MB", "32")) * 1024 * 1024
+CACHE_TTL = float(os.environ.get("ANALISADOR_TTL_HORAS", "24")) * 3600
+PAGE_SIZES = [25, 50, 100]
+SORT_OPTIONS = {
+    "Maior valor": ("valor", False),
+    "Menor valor": ("valor", True),
+    "Mais dias afetados": ("dias", False),
+    "Mais recentes": ("data", False),
+    "Mais antigas": ("data", True),
+    "Codigo": ("ordem_codigo", True),
+}
+RESET_KEYS = [
+    "analysis_done",
+    "result",
+    "issues",
+    "balance_index",
+    "issue_view",
+    "file_name",
+    "analysis_time",
+    "selected_row",
+    "search",
+    "analysis_key",
+    "export_ready",
+    "page",
+    "table_filters",
+]
 
 
 def load_logo_data_uri() -> str:
@@ -317,10 +358,16 @@ def ensure_state() -> None:
         "analysis_done": False,
         "result": pd.DataFrame(),
         "issues": pd.DataFrame(),
+        "balance_index": None,
+        "issue_view": pd.DataFrame(),
         "file_name": "",
         "analysis_time": "",
         "selected_row": None,
         "search": "",
+        "analysis_key": "",
+        "export_ready": False,
+        "page": 1,
+        "table_filters": None,
     }
     for key, value in defaults.items():
         if key not in st.session_state:
@@ -362,6 +409,8 @@ def render_sidebar() -> None:
     file_name = st.session_state.get("file_name") or "Nenhum arquivo analisado"
     analysis_time = st.session_state.get("analysis_time") or "-"
     status = "Análise concluída" if st.session_state.get("analysis_done") else "Aguardando arquivos"
+    counters = dedup_counters()
+    reused = counters["lookups"] - counters["computed"]
     st.sidebar.markdown(
         f"""
         <div class="side-file-card">
@@ -369,13 +418,14 @@ def render_sidebar() -> None:
             <strong>{file_name}</strong>
             <small style="margin-top:10px">Atualizado em {analysis_time}</small>
             <span class="side-status">{status}</span>
+            <small style="margin-top:10px">Análises reaproveitadas: {reused} de {counters["lookups"]}</small>
         </div>
         """,
         unsafe_allow_html=True,
     )
 
     if st.sidebar.button("Nova análise", use_container_width=True):
-        for key in ["analysis_done", "result", "issues", "file_name", "analysis_time", "selected_row", "search"]:
+        for key in RESET_KEYS:
             st.session_state.pop(key, None)
         ensure_state()
         st.rerun()
@@ -403,33 +453,50 @@ def br_money(value: Any) -> str:
     return f"({formatted})" if number < 0 else formatted
 
 
-def classify_row(row: pd.Series) -> str:
-    text = " ".join(
-        str(row.get(column, ""))
-        for column in ["Codigo da conta", "Conta analisada", "Nome da conta no razao", "Nome no plano de contas", "Grupo"]
-    ).lower()
-    if "fornecedor" in text or str(row.get("Codigo da conta", "")) == "148":
-        return "Fornecedor"
-    if "cliente" in text:
-        return "Cliente"
-    return "Conta"
-
-
-def participant_code(row: pd.Series) -> str:
-    codigo = str(row.get("Codigo da conta", "")).strip()
-    name = str(row.get("Nome da conta no razao", "")).strip()
-    first = name.split(" ", 1)[0].strip()
-    if first.isdigit():
-        return f"{codigo} - {first}"
-    return codigo
-
-
-def description(row: pd.Series) -> str:
-    name = str(row.get("Nome da conta no razao", "")).strip()
-    pieces = name.split(" ", 1)
-    if pieces and pieces[0].isdigit() and len(pieces) > 1:
-        return pieces[1].lstrip("- ").strip()
-    return name or str(row.get("Conta analisada", ""))
+def build_issue_view(issues: pd.DataFrame) -> pd.DataFrame:
+    if issues.empty:
+        return pd.DataFrame(columns=["busca", "tipo", "codigo", "descricao", "valor", "dias", "data", "ordem_codigo"])
+
+    def text(column: str) -> pd.Series:
+        if column not in issues.columns:
+            return pd.Series("", index=issues.index)
+        return issues[column].astype(str)
+
+    codigo = text("Codigo da conta").str.strip()
+    name = text("Nome da conta no razao").str.strip()
+    pieces = name.str.split(" ", n=1)
+    first = pieces.str[0].fillna("")
+    rest = pieces.str[1]
+    numbered = first.str.isdigit()
+
+    classification = (
+        text("Codigo da conta") + " " + text("Conta analisada") + " " + text("Nome da conta no razao")
+        + " " + text("Nome no plano de contas") + " " + text("Grupo")
+    ).str.lower()
+    tipo = np.select(
+        [classification.str.contains("fornecedor", regex=False) | text("Codigo da conta").eq("148"), classification.str.contains("cliente", regex=False)],
+        ["Fornecedor", "Cliente"],
+        "Conta",
+    )
+    descricao = name.where(name != "", text("Conta analisada"))
+    descricao = descricao.mask(numbered & rest.notna(), rest.str.lstrip("- ").str.strip())
+
+    row_text = text(issues.columns[0])
+    for column in issues.columns[1:]:
+        row_text = row_text + " " + text(column)
+    return pd.DataFrame(
+        {
+            "busca": row_text.map(normalize_text),
+            "tipo": tipo,
+            "codigo": codigo.mask(numbered, codigo + " - " + first),
+            "descricao": descricao,
+            "valor": pd.to_numeric(issues.get("Saldo final do dia", 0), errors="coerce").abs(),
+            "dias": pd.to_numeric(issues.get("Dias impactados", 1), errors="coerce").fillna(1),
+            "data": pd.to_datetime(text("Data"), format="%d/%m/%Y", errors="coerce"),
+            "ordem_codigo": pd.to_numeric(codigo, errors="coerce"),
+        },
+        index=issues.index,
+    )
 
 
 def expected_label(row: pd.Series) -> str:
@@ -442,7 +509,7 @@ def current_label(row: pd.Series) -> str:
     return "Devedor" if nature == "credora" else "Credor" if nature == "devedora" else "Revisao"
 
 
-def metric_summary(result: pd.DataFrame, issues: pd.DataFrame) -> dict[str, str]:
+def metric_summary(result: pd.DataFrame, issues: pd.DataFrame, view: pd.DataFrame) -> dict[str, str]:
     if result.empty:
         return {
             "issues": "0",
@@ -461,8 +528,7 @@ def metric_summary(result: pd.DataFrame, issues: pd.DataFrame) -> dict[str, str]
         period = f"{min_date.strftime('%d/%m/%Y')} a {max_date.strftime('%d/%m/%Y')}"
         days = f"{dates.dropna().nunique()} dias analisados"
 
-    issue_types = issues.apply(classify_row, axis=1) if not issues.empty else pd.Series(dtype=str)
-    participants = int(issue_types.isin(["Fornecedor", "Cliente"]).sum())
+    participants = int(view["tipo"].isin(["Fornecedor", "Cliente"]).sum())
 
     return {
         "issues": str(len(issues)),
@@ -473,6 +539,42 @@ def metric_summary(result: pd.DataFrame, issues: pd.DataFrame) -> dict[str, str]
     }
 
 
+@st.cache_resource
+def dedup_counters() -> dict[str, int]:
+    return {"lookups": 0, "computed": 0}
+
+
+def load_upload(digest: str, data: bytes) -> pd.DataFrame:
+    if len(data) > UPLOAD_CACHE_MAX_BYTES:
+        return read_csv_semicolon(io.BytesIO(data))
+    return read_upload(digest, ENGINE_VERSION, data)
+
+
+@st.cache_data(show_spinner=False, max_entries=UPLOAD_CACHE_ENTRIES, ttl=CACHE_TTL)
+def read_upload(digest: str, engine_version: str, _data: bytes) -> pd.DataFrame:
+    return read_csv_semicolon(io.BytesIO(_data))
+
+
+@st.cache_data(show_spinner=False, max_entries=ANALYSIS_CACHE_ENTRIES, ttl=CACHE_TTL)
+def analyze_uploads(
+    content_key: str,
+    plan_digest: str,
+    ledger_digest: str,
+    _plan_bytes: bytes,
+    _ledger_bytes: bytes,
+) -> tuple[pd.DataFrame, pd.DataFrame, BalanceIndex, pd.DataFrame]:
+    dedup_counters()["computed"] += 1
+    plan_df = load_upload(plan_digest, _plan_bytes)
+    ledger_df = load_upload(ledger_digest, _ledger_bytes)
+    result, issues = analyze_balances(ledger_df, plan_df)
+    return result, issues, build_balance_index(result), build_issue_view(issues)
+
+
+@st.cache_data(show_spinner=False, max_entries=ANALYSIS_CACHE_ENTRIES, ttl=CACHE_TTL)
+def export_excel(content_key: str, _issues: pd.DataFrame) -> bytes:
+    return dataframe_to_excel(_issues)
+
+
 def render_upload_area() -> None:
     st.markdown(
         """
@@ -497,30 +599,38 @@ def render_upload_area() -> None:
                 st.warning("Envie o plano de contas e o razão diário para iniciar a análise.")
                 return
             try:
-                plan_df = read_csv_semicolon(plan_file)
-                ledger_df = read_csv_semicolon(ledger_file)
-                result, issues = analyze_balances(ledger_df, plan_df)
+                plan_bytes = plan_file.getvalue()
+                ledger_bytes = ledger_file.getvalue()
+                plan_digest = content_digest(plan_bytes)
+                ledger_digest = content_digest(ledger_bytes)
+                content_key = analysis_key(plan_digest, ledger_digest)
+                dedup_counters()["lookups"] += 1
+                result, issues, balance_index, issue_view = analyze_uploads(content_key, plan_digest, ledger_digest, plan_bytes, ledger_bytes)
             except Exception as exc:
                 st.error(f"Nao foi possivel analisar os arquivos: {exc}")
                 return
 
             st.session_state.result = result
             st.session_state.issues = issues
+            st.session_state.balance_index = balance_index
+            st.session_state.issue_view = issue_view
             st.session_state.analysis_done = True
             st.session_state.file_name = ledger_file.name
             st.session_state.analysis_time = datetime.now().strftime("%d/%m/%Y %H:%M")
             st.session_state.selected_row = None
+            st.session_state.analysis_key = content_key
+            st.session_state.export_ready = False
             st.rerun()
 
 
-def render_table_row(row: pd.Series, index: int) -> None:
-    row_type = classify_row(row)
+def render_table_row(row: pd.Series, view_row: pd.Series, index: int) -> None:
+    row_type = view_row["tipo"]
     expected = expected_label(row)
     current = current_label(row)
     cols = st.columns([1.15, 1.3, 3.0, 1.25, 1.2, 1.15, 1.25, 1.0, .75])
     cols[0].markdown(render_status_badge(row_type, row_type.lower()), unsafe_allow_html=True)
-    cols[1].markdown(f"<div class='table-row-cell'>{participant_code(row)}</div>", unsafe_allow_html=True)
-    cols[2].markdown(f"<div class='table-row-cell desc'>{description(row)}</div>", unsafe_allow_html=True)
+    cols[1].markdown(f"<div class='table-row-cell'>{view_row['codigo']}</div>", unsafe_allow_html=True)
+    cols[2].markdown(f"<div class='table-row-cell desc'>{view_row['descricao']}</div>", unsafe_allow_html=True)
     cols[3].markdown(render_status_badge(expected, expected.lower()), unsafe_allow_html=True)
     cols[4].markdown(render_status_badge(current, current.lower()), unsafe_allow_html=True)
     cols[5].markdown(br_money(row.get("Saldo final do dia", 0)))
@@ -531,7 +641,7 @@ def render_table_row(row: pd.Series, index: int) -> None:
         st.session_state.selected_row = selected if st.session_state.selected_row != selected else None
 
 
-def render_inconsistencias_table(issues: pd.DataFrame) -> None:
+def render_inconsistencias_table(issues: pd.DataFrame, view: pd.DataFrame) -> None:
     st.markdown(
         """
         <div class="section-panel">
@@ -552,25 +662,49 @@ def render_inconsistencias_table(issues: pd.DataFrame) -> None:
     with filter_col:
         tipo = st.selectbox("Filtros", ["Todos", "Fornecedor", "Cliente", "Conta"], label_visibility="collapsed")
     with export_col:
-        st.download_button(
-            "Exportar Excel",
-            data=dataframe_to_excel(issues),
-            file_name="inconsistencias_analisador_contabil.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True,
-        )
+        if st.session_state.export_ready:
+            st.download_button(
+                "Exportar Excel",
+                data=export_excel(st.session_state.analysis_key, issues),
+                file_name="inconsistencias_analisador_contabil.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True,
+            )
+        elif st.button("Preparar Excel", use_container_width=True):
+            st.session_state.export_ready = True
+            st.rerun()
 
-    filtered = issues.copy()
-    if search:
-        mask = filtered.apply(lambda row: search.lower() in " ".join(map(str, row.values)).lower(), axis=1)
-        filtered = filtered[mask]
+    mask = np.ones(len(view), dtype=bool)
+    query = normalize_text(search)
+    if query:
+        mask &= view["busca"].str.contains(query, regex=False).to_numpy()
     if tipo != "Todos":
-        filtered = filtered[filtered.apply(classify_row, axis=1).eq(tipo)]
+        mask &= view["tipo"].to_numpy() == tipo
+    filtered = view[mask]
+
+    sort_col, size_col, page_col = st.columns([2.2, 1.1, 1.1])
+    with sort_col:
+        sort = st.selectbox("Ordenar por", list(SORT_OPTIONS), key="sort")
+    with size_col:
+        page_size = st.selectbox("Linhas por pagina", PAGE_SIZES, key="page_size")
 
     if filtered.empty:
         st.markdown('<div class="empty-state">Nenhum caso encontrado para os filtros atuais.</div>', unsafe_allow_html=True)
         return
 
+    filters = (search, tipo, sort, page_size)
+    if st.session_state.table_filters != filters:
+        st.session_state.table_filters = filters
+        st.session_state.page = 1
+    pages = max(1, -(-len(filtered) // page_size))
+    st.session_state.page = min(max(st.session_state.page, 1), pages)
+    with page_col:
+        st.number_input("Pagina", min_value=1, max_value=pages, key="page")
+
+    start = (st.session_state.page - 1) * page_size
+    visible = sort_issues(filtered, sort).iloc[start : start + page_size]
+    rows = issues.loc[visible.index]
+
     st.markdown(
         """
         <div class="table-header">
@@ -581,11 +715,27 @@ def render_inconsistencias_table(issues: pd.DataFrame) -> None:
         unsafe_allow_html=True,
     )
 
-    for index, row in filtered.reset_index(drop=True).iterrows():
+    for (index, row), (_, view_row) in zip(rows.iterrows(), visible.iterrows()):
         st.markdown('<div class="table-row">', unsafe_allow_html=True)
-        render_table_row(row, index)
+        render_table_row(row, view_row, index)
         st.markdown("</div>", unsafe_allow_html=True)
-    st.caption(f"Mostrando {len(filtered)} de {len(issues)} resultados")
+
+    previous_col, caption_col, next_col = st.columns([1, 4, 1])
+    previous_col.button("Anterior", disabled=st.session_state.page <= 1, on_click=turn_page, args=(-1,), use_container_width=True)
+    next_col.button("Proxima", disabled=st.session_state.page >= pages, on_click=turn_page, args=(1,), use_container_width=True)
+    caption_col.caption(
+        f"Mostrando {start + 1} a {start + len(visible)} de {len(filtered)} resultados filtrados "
+        f"({len(issues)} no total) - pagina {st.session_state.page} de {pages}"
+    )
+
+
+def turn_page(step: int) -> None:
+    st.session_state.page += step
+
+
+def sort_issues(view: pd.DataFrame, sort: str) -> pd.DataFrame:
+    key, ascending = SORT_OPTIONS[sort]
+    return view.sort_values(key, ascending=ascending, na_position="last", kind="stable")
 
 
 def render_detalhes() -> None:
@@ -594,15 +744,15 @@ def render_detalhes() -> None:
         return
 
     issues: pd.DataFrame = st.session_state.issues
-    result: pd.DataFrame = st.session_state.result
     selected_rows = issues[issues["Conta analisada"].astype(str).eq(str(selected))]
     if selected_rows.empty:
         return
 
     row = selected_rows.iloc[0]
-    history = result[result["Conta analisada"].astype(str).eq(str(selected))].copy()
-    history["_data_dt"] = pd.to_datetime(history["Data"], format="%d/%m/%Y", errors="coerce")
-    history = history.sort_values("_data_dt")
+    index: BalanceIndex | None = st.session_state.get("balance_index")
+    if index is None:
+        index = build_balance_index(st.session_state.result)
+        st.session_state.balance_index = index
 
     st.markdown(
         f"""
@@ -619,11 +769,16 @@ def render_detalhes() -> None:
         unsafe_allow_html=True,
     )
 
-    if not history.empty:
-        chart_df = history[["_data_dt", "Saldo final do dia"]].dropna().set_index("_data_dt").tail(90)
+    if index.bounds(str(selected)) is not None:
+        chart_window = index.tail(str(selected), 90)
+        chart_df = pd.DataFrame(
+            {"Saldo final do dia": index.balances[chart_window]},
+            index=index.dates(chart_window).rename("_data_dt"),
+        )
         st.line_chart(chart_df, height=220)
+        table_window = index.tail(str(selected), 40)
         st.dataframe(
-            history[["Data", "Saldo final do dia"]].tail(40),
+            pd.DataFrame({"Data": index.labels[table_window], "Saldo final do dia": index.balances[table_window]}),
             use_container_width=True,
             hide_index=True,
         )
@@ -632,7 +787,8 @@ def render_detalhes() -> None:
 def render_dashboard() -> None:
     result: pd.DataFrame = st.session_state.result
     issues: pd.DataFrame = st.session_state.issues
-    summary = metric_summary(result, issues)
+    view: pd.DataFrame = st.session_state.issue_view
+    summary = metric_summary(result, issues, view)
 
     st.markdown(
         """
@@ -648,7 +804,7 @@ def render_dashboard() -> None:
     )
 
     if st.button("Enviar novo arquivo", key="new_upload_top"):
-        for key in ["analysis_done", "result", "issues", "file_name", "analysis_time", "selected_row", "search"]:
+        for key in RESET_KEYS:
             st.session_state.pop(key, None)
         ensure_state()
         st.rerun()
@@ -664,7 +820,7 @@ def render_dashboard() -> None:
         render_metric_card("Periodo Analisado", summary["period"], summary["period_hint"], "var(--green)")
 
     st.write("")
-    render_inconsistencias_table(issues)
+    render_inconsistencias_table(issues, view)
     render_detalhes()
 
 
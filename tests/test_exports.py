@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import io
+
+import pandas as pd
+import pytest
+
+import core
+
+pytest.importorskip("pyarrow")
+
+
+def issues_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Codigo da conta": ["100", "148", "210"],
+            "Conta analisada": ["100 - Caixa", "148 - Fornecedor Alfa", "210 - Cliente Beta"],
+            "Data": ["01/01/2024", "02/01/2024", "03/01/2024"],
+            "Saldo final do dia": [-10.5, 20.0, -3.25],
+            "Tipo de inconsistencia": ["Saldo credor em conta de natureza devedora", "", None],
+            "Data final da sequencia": [None, None, None],
+        }
+    ).astype({"Codigo da conta": object, "Conta analisada": object, "Data": object, "Tipo de inconsistencia": object})
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "feather"])
+def test_write_columnar_keeps_text_columns(file_format: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(core, "EXPORT_CHUNK_ROWS", 2)
+    frame = issues_frame()
+    buffer = io.BytesIO()
+    core.write_columnar(frame, buffer, file_format)
+    buffer.seek(0)
+    loaded = pd.read_parquet(buffer) if file_format == "parquet" else pd.read_feather(buffer)
+    assert loaded["Conta analisada"].tolist() == frame["Conta analisada"].tolist()
+    assert loaded["Saldo final do dia"].tolist() == frame["Saldo final do dia"].tolist()
+    assert loaded["Data final da sequencia"].isna().all()